@@ -39,9 +39,12 @@
 
 import bpy, struct, bmesh, numpy
 import os
+import mmap
+import collections, collections.abc
+import bisect
 import subprocess
 import gzip
-from sys import platform
+from sys import platform, intern
 
 import socket  
 
@@ -131,37 +134,166 @@ class BFRESslot():
     
 flipYZ = Matrix(((1,0,0,0), (0,0,-1,0), (0,1,0,0), (0,0,0,1)))
 
+# Precompiled big-endian scalars for the accessors that index into arrays.
+u16 = struct.Struct(">H")
+s16 = struct.Struct(">h")
+u32 = struct.Struct(">I")
+s32 = struct.Struct(">i")
+s32x2 = struct.Struct(">2i")
+f32x4 = struct.Struct(">4f")
+
+# Field flags for the section tables below.
+VALUE = 0
+SETTABLE = 1    # accessor takes set=, writes go through the edit journal
+POINTER = 2     # relative pointer, the accessor resolves it to an absolute offset
+
+def field_accessor(offset, fmt, flags):
+    st = struct.Struct(">"+fmt)
+    unpack_from = st.unpack_from
+    single = len(st.unpack(bytes(st.size))) == 1
+    if flags & POINTER:
+        def read(self):
+            o = self.offset+offset
+            return o+unpack_from(self.bfres.bytes, o)[0]
+    elif single:
+        def read(self):
+            return unpack_from(self.bfres.bytes, self.offset+offset)[0]
+    else:
+        def read(self):
+            return unpack_from(self.bfres.bytes, self.offset+offset)
+    if not flags & SETTABLE:
+        return read
+    def accessor(self, set=None):
+        if set is not None:
+            if flags & POINTER:
+                set = set-(self.offset+offset)
+            self.bfres.write_bytes(self.offset+offset, st.pack(set) if single else st.pack(*set))
+        return read(self)
+    return accessor
+
+def header_reader(name, fields):
+    # One unpack_from over the whole header, gaps between fields are skipped with pad bytes.
+    fields = sorted(fields, key=lambda field: field[1])
+    fmt = ">"
+    end = 0
+    layout = []
+    for field_name, offset, field_fmt, flags in fields:
+        if offset < end:
+            raise ValueError("%s: field %s overlaps the previous one" % (name, field_name))
+        st = struct.Struct(">"+field_fmt)
+        fmt += "%ix%s" % (offset-end, field_fmt) if offset > end else field_fmt
+        end = offset+st.size
+        layout.append((len(st.unpack(bytes(st.size))), offset if flags & POINTER else None))
+    whole = struct.Struct(fmt)
+    header_tuple = collections.namedtuple(name, [field[0] for field in fields])
+    def header(self):
+        values = whole.unpack_from(self.bfres.bytes, self.offset)
+        out = []
+        i = 0
+        for count, pointer in layout:
+            if count > 1:
+                out.append(values[i:i+count])
+            elif pointer is not None:
+                out.append(self.offset+pointer+values[i])
+            else:
+                out.append(values[i])
+            i += count
+        return header_tuple._make(out)
+    return header
+
+def section(cls):
+    # Turns the class' fields table of (name, offset, struct format, flags) into accessors.
+    for name, offset, fmt, flags in cls.fields:
+        setattr(cls, name, field_accessor(offset, fmt, flags))
+    cls.header = header_reader(cls.__name__+"header", cls.fields)
+    return cls
+
+class indexGroup():
+    # An index group parsed in one pass. entries is the ordered tuple of (name, entry offset),
+    # lookup maps each name to its position (the first one when a name repeats).
+    def __init__(self, bfres, offset):
+        data = bfres.bytes
+        count = u32.unpack_from(data, offset+4)[0]
+        entries = []
+        lookup = {}
+        names_start = names_end = None
+        for i in range(count):
+            name_pointer_offset = offset+0x20+i*0x10
+            name_pointer, data_pointer = s32x2.unpack_from(data, name_pointer_offset)
+            name_offset = name_pointer_offset+name_pointer
+            name = bfres.string(name_offset)
+            size_of_name = s32.unpack_from(data, name_offset-4)[0]
+            if name not in lookup: lookup[name] = i
+            entries.append((name, name_pointer_offset+4+data_pointer))
+            if names_start is None or name_offset-4 < names_start: names_start = name_offset-4
+            if names_end is None or name_offset+size_of_name > names_end: names_end = name_offset+size_of_name
+        self.entries = tuple(entries)
+        self.lookup = lookup
+        self.ranges = [(offset, offset+0x18+count*0x10)]
+        if names_start is not None: self.ranges.append((names_start, names_end))
+    def __len__(self):
+        return len(self.entries)
+    def name(self, i):
+        return self.entries[i][0]
+    def data_offset(self, i):
+        return self.entries[i][1]
+    def index(self, name):
+        return self.lookup.get(name)
+
+class sectionMap(collections.abc.Mapping):
+    # Name -> section handle over an index group, in file order. Nothing is parsed until the
+    # map is used, and handles come from BFRES.handle so every section keeps one object.
+    # group_offset() returns None when the group is absent.
+    def __init__(self, bfres, group_offset, cls, parent=None):
+        self.bfres = bfres
+        self.group_offset = group_offset
+        self.cls = cls
+        self.parent = parent
+    def group(self):
+        offset = self.group_offset()
+        return self.bfres.index_group(offset) if offset is not None else None
+    def handle(self, i):
+        return self.bfres.handle(self.cls, self.group().data_offset(i), self.parent)
+    def __getitem__(self, name):
+        group = self.group()
+        i = group.index(name) if group is not None else None
+        if i is None: raise KeyError(name)
+        return self.handle(i)
+    def __contains__(self, name):
+        group = self.group()
+        return group is not None and group.index(name) is not None
+    def __iter__(self):
+        group = self.group()
+        return iter([entry[0] for entry in group.entries] if group is not None else [])
+    def __len__(self):
+        group = self.group()
+        return len(group) if group is not None else 0
+
+@section
 class LoD():
+    fields = (
+        ("primitive_type", 0x0, "I", VALUE),
+        ("index_format", 0x4, "I", VALUE),
+        ("count_of_points", 0x8, "I", VALUE),
+        ("visibility_group_count", 0xC, "H", SETTABLE),
+        ("visibility_group_offset", 0x10, "i", POINTER),
+        ("index_buffer_offset", 0x14, "i", POINTER),
+        ("skip_count", 0x18, "I", SETTABLE),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def primitive_type(self):
-        return struct.unpack(">I", self.bfres.bytes[self.offset:self.offset+0x4])[0]
-    def index_format(self):
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x4:self.offset+0x8])[0]
-    def count_of_points(self):
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x8:self.offset+0xC])[0]
-    def index_buffer_offset(self):
-        return self.offset+0x14+struct.unpack(">i", self.bfres.bytes[self.offset+0x14:self.offset+0x18])[0]
-    def skip_count(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x18] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x1C:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x18:self.offset+0x1C])[0]
-    def visibility_group_count(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0xC] + struct.pack(">H", set) + self.bfres.bytes[self.offset+0xE:]
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0xC:self.offset+0xE])[0]
     def visibility_group_data_offset(self, i, set=None):
-        offset = self.offset+0x10+struct.unpack(">i", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]
+        offset = self.visibility_group_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+i*8] + struct.pack(">i", set) + self.bfres.bytes[offset+4+i*8:]
-        return struct.unpack(">i", self.bfres.bytes[offset+i*8:offset+4+i*8])[0]
+            self.bfres.write(offset+i*8, ">i", set)
+        return s32.unpack_from(self.bfres.bytes, offset+i*8)[0]
     def visibility_group_data_count(self, i, set=None):
-        offset = self.offset+0x10+struct.unpack(">i", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]
+        offset = self.visibility_group_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+4+i*8] + struct.pack(">i", set) + self.bfres.bytes[offset+8+i*8:]
-        return struct.unpack(">i", self.bfres.bytes[offset+4+i*8:offset+8+i*8])[0]
+            self.bfres.write(offset+4+i*8, ">i", set)
+        return s32.unpack_from(self.bfres.bytes, offset+4+i*8)[0]
     def primitive_type_string(self):
         pt = self.primitive_type()
         if pt == 0x01: return "GX2_PRIMITIVE_POINTS"                        #< min = 1; incr = 1
@@ -197,24 +329,49 @@ class LoD():
     def get_buffer_offset(self, set=None):
         offset = self.index_buffer_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+0x14] + struct.pack(">i", set) + self.bfres.bytes[offset+0x18:]
-        return offset+0x14+struct.unpack(">i", self.bfres.bytes[offset+0x14:offset+0x18])[0]
-    
+            self.bfres.write(offset+0x14, ">i", set-(offset+0x14))
+        return offset+0x14+s32.unpack_from(self.bfres.bytes, offset+0x14)[0]
+
     def get_buffer_size(self, set=None):
         offset = self.index_buffer_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+0x4] + struct.pack(">i", set) + self.bfres.bytes[offset+0x8:]
-        return struct.unpack(">i", self.bfres.bytes[offset+0x4:offset+0x8])[0]
+            self.bfres.write(offset+0x4, ">i", set)
+        return s32.unpack_from(self.bfres.bytes, offset+0x4)[0]
+
+    def buffer_view(self):
+        return self.bfres.view(self.get_buffer_offset(), self.get_buffer_size())
+
+    def decode_faces(self):
+        # (F, 3) triangles from every visibility group with skip_count added, None when the
+        # index format or primitive type isn't supported.
+        type_ = index_formats.get(self.index_format())
+        triangulate = primitive_triangulators.get(self.primitive_type())
+        if type_ is None or triangulate is None: return None
+        type_ = numpy.dtype(type_)
+        buffer = self.buffer_view()
+        faces = [numpy.empty((0, 3), numpy.int64)]
+        for i in range(self.visibility_group_count()):
+            indices = numpy.frombuffer(buffer, type_, self.visibility_group_data_count(i), self.visibility_group_data_offset(i)).astype(numpy.int64)
+            if self.primitive_type() in (0x05, 0x06):
+                # Strips and fans start over after each primitive restart index.
+                restart = numpy.iinfo(type_).max
+                for run in numpy.split(indices, numpy.flatnonzero(indices == restart)+1):
+                    faces.append(triangulate(run[:-1] if len(run) and run[-1] == restart else run))
+            else:
+                faces.append(triangulate(indices))
+        return numpy.concatenate(faces)+self.skip_count()
 
+@section
 class vtxAttribute():
+    fields = (
+        ("buffer_index", 0x4, "B", VALUE),
+        ("buffer_offset", 0x6, "h", SETTABLE),
+        ("format", 0x8, "I", VALUE),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def buffer_index(self):
-        return self.bfres.bytes[self.offset+4]
-    def format(self):
-        return struct.unpack(">I", self.bfres.bytes[self.offset+8:self.offset+0xC])[0]
     def format_string(self):
         fmt = self.format()
         if fmt == 0x0000:    return "unorm_8"
@@ -239,112 +396,162 @@ class vtxAttribute():
         elif fmt == 0x0811:    return "float_32_32_32"
         elif fmt == 0x0813:    return "float_32_32_32_32"
         else: return "unknown"
-    def buffer_offset(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x6] + struct.pack(">h", set) + self.bfres.bytes[self.offset+0x8:]
-        return struct.unpack(">h", self.bfres.bytes[self.offset+0x6:self.offset+0x8])[0]
 
+@section
 class FVTX():
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("attribute_count", 0x4, "B", VALUE),
+        ("buffer_count", 0x5, "B", VALUE),
+        ("section_index", 0x6, "H", VALUE),
+        ("num_vertices", 0x8, "I", SETTABLE),
+        ("vertex_skin_count", 0xC, "B", VALUE),
+        ("attribute_array_offset", 0x10, "i", POINTER),
+        ("attribute_index_group_offset", 0x14, "i", POINTER),
+        ("buffer_array_offset", 0x18, "i", POINTER),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def magic(self):
-        return self.bfres.bytes[self.offset:self.offset+4]
-    def attribute_count(self):
-        return self.bfres.bytes[self.offset+4]
-    def buffer_count(self):
-        return self.bfres.bytes[self.offset+5]
-    def section_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+6:self.offset+8])[0]
-    def num_vertices(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+8] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0xC:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+8:self.offset+0xC])[0]
-    def vertex_skin_count(self):
-        return self.bfres.bytes[self.offset+0xC]
-    def attribute_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]+0x10
-    def attribute_index_group_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x14:self.offset+0x18])[0]+0x14
-    def buffer_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x18:self.offset+0x1C])[0]+0x18
-    
+
     def get_attribute_name(self, i):
-        offset = self.attribute_index_group_offset()
-        name_pointer_offset = offset+0x20+i*0x10
-        name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-        size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-        return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
-    
+        return self.bfres.index_group(self.attribute_index_group_offset()).name(i)
+
     def get_attribute_data(self, i):
-        offset = self.attribute_index_group_offset()
-        pointer_offset = offset+0x24+i*0x10
-        offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-        return vtxAttribute(offset, self, self.bfres)
-    
+        return self.bfres.handle(vtxAttribute, self.bfres.index_group(self.attribute_index_group_offset()).data_offset(i), self)
+
     def get_buffer_offset(self, i, set=None):
         offset = self.buffer_array_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+i*0x18+0x14] + struct.pack(">i", set) + self.bfres.bytes[offset+i*0x18+0x18:]
-        return offset+i*0x18+struct.unpack(">i", self.bfres.bytes[offset+i*0x18+0x14:offset+i*0x18+0x18])[0]+0x14
-    
+            self.bfres.write(offset+i*0x18+0x14, ">i", set-(offset+i*0x18+0x14))
+        return offset+i*0x18+s32.unpack_from(self.bfres.bytes, offset+i*0x18+0x14)[0]+0x14
+
     def get_buffer_size(self, i, set=None):
         offset = self.buffer_array_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+i*0x18+0x4] + struct.pack(">I", set) + self.bfres.bytes[offset+i*0x18+0x8:]
-        return struct.unpack(">I", self.bfres.bytes[offset+i*0x18+0x4:offset+i*0x18+0x8])[0]
-    
+            self.bfres.write(offset+i*0x18+0x4, ">I", set)
+        return u32.unpack_from(self.bfres.bytes, offset+i*0x18+0x4)[0]
+
     def get_buffer_stride(self, i, set=None):
         offset = self.buffer_array_offset()
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:offset+i*0x18+0xC] + struct.pack(">H", set) + self.bfres.bytes[offset+i*0x18+0xE:]
-        return struct.unpack(">H", self.bfres.bytes[offset+i*0x18+0xC:offset+i*0x18+0xE])[0]
-    
+            self.bfres.write(offset+i*0x18+0xC, ">H", set)
+        return u16.unpack_from(self.bfres.bytes, offset+i*0x18+0xC)[0]
+
+    def buffer_view(self, i):
+        return self.bfres.view(self.get_buffer_offset(i), self.get_buffer_size(i))
+
+    def buffer_dtype(self, i):
+        # One record per vertex with a field for each attribute stored in buffer i, named after it.
+        names, formats, offsets = [], [], []
+        for k in range(self.attribute_count()):
+            attr = self.get_attribute_data(k)
+            fmt = attr.format_string()
+            if attr.buffer_index() != i or fmt not in attribute_formats: continue
+            names.append(self.get_attribute_name(k))
+            formats.append((attribute_formats[fmt][0], (attribute_formats[fmt][1],)))
+            offsets.append(attr.buffer_offset())
+        return numpy.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": self.get_buffer_stride(i)})
+
+    def read_buffer(self, i, start=0, stop=None):
+        # Records of vertices start to stop, only their part of the buffer is touched.
+        if stop is None: stop = self.num_vertices()
+        dtype = self.buffer_dtype(i)
+        if stop <= start: return numpy.zeros(0, dtype)
+        return numpy.frombuffer(self.buffer_view(i), dtype, stop-start, start*dtype.itemsize)
+
+    def decode_attributes(self, start=0, stop=None):
+        # Every attribute with a known format by name, as (N, C) float32 arrays for vertices start
+        # to stop. Each buffer is read once.
+        buffers = [self.read_buffer(i, start, stop) for i in range(self.buffer_count())]
+        values = {}
+        for k in range(self.attribute_count()):
+            attr = self.get_attribute_data(k)
+            name = self.get_attribute_name(k)
+            records = buffers[attr.buffer_index()]
+            if name in records.dtype.names:
+                values[name] = decode_values(attr.format_string(), records[name])
+        return values
+
+@section
 class FSHP():
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("section_index", 0xC, "H", VALUE),
+        ("material_index", 0xE, "H", VALUE),
+        ("skeleton_index", 0x10, "H", VALUE),
+        ("vertex_index", 0x12, "H", VALUE),
+        ("skeleton_bone_skin_index", 0x14, "H", VALUE),
+        ("vertex_skin_count", 0x16, "B", VALUE),
+        ("LoD_model_count", 0x17, "B", VALUE),
+        ("key_shape_count", 0x18, "B", VALUE),
+        ("vertex_offset", 0x20, "i", POINTER),
+        ("LoD_model_offset", 0x24, "i", POINTER),
+        ("skeleton_index_array_offset", 0x28, "i", POINTER),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def magic(self):
-        return self.bfres.bytes[self.offset:self.offset+4]
-    def section_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0xC:self.offset+0xE])[0]
-    def material_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0xE:self.offset+0x10])[0]
-    def skeleton_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0x10:self.offset+0x12])[0]
-    def vertex_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0x12:self.offset+0x14])[0]
-    def skeleton_bone_skin_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0x14:self.offset+0x16])[0]
-    def vertex_skin_count(self):
-        return self.bfres.bytes[self.offset+0x16]
-    def LoD_model_count(self):
-        return self.bfres.bytes[self.offset+0x17]
-    def key_shape_count(self):
-        return self.bfres.bytes[self.offset+0x18]
-    def vertex_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x20:self.offset+0x24])[0]+0x20
-    def LoD_model_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x24:self.offset+0x28])[0]+0x24
-    def skeleton_index_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x28:self.offset+0x2C])[0]+0x28
 
     def get_LoD_model(self, i):
-        return LoD(self.LoD_model_offset()+0x1C*i, self, self.bfres)
-    
+        return self.bfres.handle(LoD, self.LoD_model_offset()+0x1C*i, self)
+
     def get_bone_index(self, i):
         offset = self.skeleton_index_array_offset()
-        return struct.unpack(">H", self.bfres.bytes[offset+2*i:offset+2*i+2])[0]
+        return u16.unpack_from(self.bfres.bytes, offset+2*i)[0]
+
+    def geometry(self, i):
+        # Decoded vertex attributes and faces of LoD i, kept until a write touches anything they were read from.
+        lod = self.get_LoD_model(i)
+        item = self.bfres.cache.get(("geometry", lod.offset))
+        if item is None:
+            geometry = shapeGeometry(self, lod)
+            item = self.bfres.cache[("geometry", lod.offset)] = (geometry, geometry.ranges)
+        return item[0]
+
+class shapeGeometry():
+    # One LoD of a shape as arrays: faces is LoD.decode_faces(), attributes is FVTX.decode_attributes()
+    # over vertices first to stop, the span the faces reference (every vertex when the faces can't be decoded).
+    # ranges covers the shape, vertex and LoD headers, attribute records, buffer descriptors and the data read.
+    def __init__(self, fshp, lod):
+        bfres = fshp.bfres
+        fvtx = FVTX(fshp.vertex_offset(), fshp.parent, bfres)
+        self.faces = lod.decode_faces()
+        if self.faces is None:
+            self.first, self.stop = 0, fvtx.num_vertices()
+        else:
+            self.first = self.stop = 0
+            indices = self.faces[((self.faces >= 0) & (self.faces < fvtx.num_vertices())).all(1)]
+            if len(indices):
+                self.first, self.stop = int(indices.min()), int(indices.max())+1
+        self.attributes = fvtx.decode_attributes(self.first, self.stop)
+        for values in list(self.attributes.values())+[self.faces]:
+            if values is not None: values.flags.writeable = False
+        self.ranges = [(fshp.offset, fshp.offset+0x2C), (fvtx.offset, fvtx.offset+0x1C), (lod.offset, lod.offset+0x1C)]
+        self.ranges += bfres.index_group(fvtx.attribute_index_group_offset()).ranges
+        for k in range(fvtx.attribute_count()):
+            offset = bfres.index_group(fvtx.attribute_index_group_offset()).data_offset(k)
+            self.ranges.append((offset, offset+0xC))
+        self.ranges.append((fvtx.buffer_array_offset(), fvtx.buffer_array_offset()+fvtx.buffer_count()*0x18))
+        for i in range(fvtx.buffer_count()):
+            stride = fvtx.get_buffer_stride(i)
+            self.ranges.append((fvtx.get_buffer_offset(i)+self.first*stride, fvtx.get_buffer_offset(i)+self.stop*stride))
+        self.ranges.append((lod.visibility_group_offset(), lod.visibility_group_offset()+lod.visibility_group_count()*8))
+        self.ranges.append((lod.index_buffer_offset(), lod.index_buffer_offset()+0x18))
+        self.ranges.append((lod.get_buffer_offset(), lod.get_buffer_offset()+lod.get_buffer_size()))
+
+@section
 class texSampParam():
+    fields = (
+        ("index", 0x14, "B", VALUE),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
-        self.bfres = bfres 
-    def index(self):
-        return self.bfres.bytes[self.offset+0x14]
-    
+        self.bfres = bfres
+
         
 class matParam():
     def __init__(self, offset, parent, bfres):
@@ -386,259 +593,230 @@ class matParam():
                 "Texture SRT * 3x4 Matrix"  if type == 28 else\
                 "<unknown: %i>" % t
     def value_offset(self):
-        return self.offset+struct.unpack(">h", self.bfres.bytes[self.offset:self.offset+2])[0]
+        return self.offset+s16.unpack_from(self.bfres.bytes, self.offset)[0]
     def value(self):
         offset = self.value_offset()
         return None
 
+@section
 class FMAT():
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("section_index", 0xC, "H", VALUE),
+        ("texture_reference_count", 0x10, "B", VALUE),
+        ("texture_param_count", 0x11, "B", VALUE),
+        ("texture_reference_array_offset", 0x28, "i", POINTER),
+        ("texture_param_array_offset", 0x30, "i", POINTER),
+        ("material_param_array_offset", 0x38, "i", POINTER),
+        ("material_param_data_offset", 0x3C, "i", POINTER),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def magic(self):
-        return self.bfres.bytes[self.offset:self.offset+4]
-    
-    def texture_reference_count(self):return self.bfres.bytes[self.offset+0x10]
-    
-    def texture_param_count(self):return self.bfres.bytes[self.offset+0x11]
 
-    def material_param_count(self):return self.bfres.bytes[self.offset+0x12]|(self.bfres.bytes[self.offset+0x13]<<8)
-    
-    def section_index(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0xC:self.offset+0xE])[0]
-    
-    def texture_param_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x30:self.offset+0x34])[0]+0x30
+    def material_param_count(self):return struct.unpack_from("<H", self.bfres.bytes, self.offset+0x12)[0]
 
     def get_texture_param_data(self, i):
+        group = self.bfres.index_group(self.texture_param_array_offset())
         for j in range(self.texture_param_count()):
-            offset = self.texture_param_array_offset()
-            pointer_offset = offset+0x24+j*0x10
-            offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-            bn = texSampParam(offset, self, self.bfres)
+            bn = self.bfres.handle(texSampParam, group.data_offset(j), self)
             if bn.index() == i:
                 return bn
     
     def get_texture_param_name(self, i):
+        group = self.bfres.index_group(self.texture_param_array_offset())
         for j in range(self.texture_param_count()):
-            offset = self.texture_param_array_offset()
-            pointer_offset = offset+0x24+j*0x10
-            offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-            bn = texSampParam(offset, self, self.bfres)
+            bn = self.bfres.handle(texSampParam, group.data_offset(j), self)
             if bn.index() == i:
-                offset = self.texture_param_array_offset()
-                name_pointer_offset = offset+0x20+j*0x10
-                name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-                size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-                return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
-          
-    def material_param_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x38:self.offset+0x3C])[0]+0x38
+                return group.name(j)
 
     def get_material_param_data(self, i):
+        group = self.bfres.index_group(self.material_param_array_offset())
         for j in range(self.material_param_count()):
-            offset = self.material_param_array_offset()
-            pointer_offset = offset+0x24+j*0x10
-            offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-            bn = matParam(offset, self, self.bfres)
+            bn = self.bfres.handle(matParam, group.data_offset(j), self)
             if bn.index() == i:
                 return bn
     
     def get_material_param_name(self, i):
+        group = self.bfres.index_group(self.material_param_array_offset())
         for j in range(self.material_param_count()):
-            offset = self.material_param_array_offset()
-            pointer_offset = offset+0x24+j*0x10
-            offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-            bn = matParam(offset, self, self.bfres)
+            bn = self.bfres.handle(matParam, group.data_offset(j), self)
             if bn.index() == i:
-                offset = self.texture_param_array_offset()
-                name_pointer_offset = offset+0x20+j*0x10
-                name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-                size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-                return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
-    def material_param_data_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x3C:self.offset+0x40])[0]+0x3C
+                return self.bfres.index_group(self.texture_param_array_offset()).name(j)
     
     def get_texture_offset(self, i):
-        offset = self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x28:self.offset+0x2C])[0]+0x28+i*8
-        return offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x4:self.offset+0x8])[0]+4
+        offset = self.texture_reference_array_offset()+i*8
+        return offset+s32.unpack_from(self.bfres.bytes, self.offset+0x4)[0]+4
     def get_texture_name(self, i):
-        offset = self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x28:self.offset+0x2C])[0]+0x28+i*8
-        name_offset = offset+struct.unpack(">i", self.bfres.bytes[offset:offset+0x4])[0]
-        size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-        return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
+        offset = self.texture_reference_array_offset()+i*8
+        return self.bfres.string(offset+s32.unpack_from(self.bfres.bytes, offset)[0])
     
+@section
 class bone():
+    fields = (
+        ("index", 0x4, "h", VALUE),
+        ("parent_index", 0x6, "h", VALUE),
+        ("smooth_matrix_index", 0x8, "h", VALUE),
+        ("rigid_matrix_index", 0xA, "h", VALUE),
+        ("billboard_index", 0xC, "h", VALUE),
+        ("flags", 0x10, "I", VALUE),
+        ("scale_vector", 0x14, "3f", SETTABLE),
+        ("rotation_vector", 0x20, "4f", SETTABLE),
+        ("translation_vector", 0x30, "3f", SETTABLE),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def index(self):
-        return struct.unpack(">h", self.bfres.bytes[self.offset+0x4:self.offset+0x6])[0]
-    def parent_index(self):
-        return struct.unpack(">h", self.bfres.bytes[self.offset+0x6:self.offset+0x8])[0]
-    def smooth_matrix_index(self):
-        return struct.unpack(">h", self.bfres.bytes[self.offset+0x8:self.offset+0xA])[0]
-    def rigid_matrix_index(self):
-        return struct.unpack(">h", self.bfres.bytes[self.offset+0xA:self.offset+0xC])[0]
-    def billboard_index(self):
-        return struct.unpack(">h", self.bfres.bytes[self.offset+0xC:self.offset+0xE])[0]
     def uses_euler(self):
-        return (struct.unpack(">I", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]&0b00000000000000000001000000000000) != 0
-    def scale_vector(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x14] + struct.pack(">fff", set[0], set[1], set[2]) + self.bfres.bytes[self.offset+0x20:]
-        return struct.unpack(">3f", self.bfres.bytes[self.offset+0x14:self.offset+0x20])
-    def rotation_vector(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x20] + struct.pack(">ffff", set[0], set[1], set[2], set[3]) + self.bfres.bytes[self.offset+0x30:]
-        return struct.unpack(">4f", self.bfres.bytes[self.offset+0x20:self.offset+0x30])
-    def translation_vector(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x30] + struct.pack(">fff", set[0], set[1], set[2]) + self.bfres.bytes[self.offset+0x3C:]
-        return struct.unpack(">3f", self.bfres.bytes[self.offset+0x30:self.offset+0x3C])
-
+        return (self.flags()&0b00000000000000000001000000000000) != 0
+
+class boneTables():
+    # Lookups between a skeleton's bone list order, bone index, name and smooth matrix slot.
+    # ranges covers what they were read from: the bone group, bone index fields and smooth index array.
+    def __init__(self, fskl):
+        bfres = fskl.bfres
+        group = bfres.index_group(fskl.bone_index_group_offset())
+        self.names = [group.name(j) for j in range(fskl.num_bones())]
+        self.order = {}
+        self.index_by_name = {}
+        bone_offsets = []
+        for j in range(fskl.num_bones()):
+            bone_offsets.append(group.data_offset(j))
+            i = s16.unpack_from(bfres.bytes, group.data_offset(j)+0x4)[0]
+            if i not in self.order: self.order[i] = j
+            if self.names[j] not in self.index_by_name: self.index_by_name[self.names[j]] = i
+        count = fskl.num_smooth_indexes()+fskl.num_rigid_indexes()
+        offset = fskl.smooth_index_array_offset()
+        self.smooth_indices = struct.unpack_from(">%dH" % count, bfres.bytes, offset)
+        self.smooth_slot = {}
+        for slot, i in enumerate(self.smooth_indices):
+            if i not in self.smooth_slot: self.smooth_slot[i] = slot
+        # Only the index fields, so writing bone transforms doesn't drop the tables.
+        self.ranges = list(group.ranges)+[(fskl.offset+0x8, fskl.offset+0x20), (offset, offset+2*count)]+[(o+0x4, o+0x6) for o in bone_offsets]
+
+@section
 class FSKL():
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("num_bones", 0x8, "H", VALUE),
+        ("num_smooth_indexes", 0xA, "H", VALUE),
+        ("num_rigid_indexes", 0xC, "H", VALUE),
+        ("bone_index_group_offset", 0x10, "i", POINTER),
+        ("bone_array_offset", 0x14, "i", POINTER),
+        ("smooth_index_array_offset", 0x18, "i", POINTER),
+        ("smooth_matrix_array_offset", 0x1C, "i", POINTER),
+    )
     def __init__(self, offset, parent, bfres):
         self.offset = offset
         self.parent = parent
         self.bfres = bfres
-    def magic(self):
-        return self.bfres.bytes[self.offset:self.offset+4]
-    def num_bones(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0x8:self.offset+0xA])[0]
-    def num_smooth_indexes(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0xA:self.offset+0xC])[0]
-    def num_rigid_indexes(self):
-        return struct.unpack(">H", self.bfres.bytes[self.offset+0xC:self.offset+0xE])[0]
-    def bone_index_group_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]+0x10
-    def bone_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x14:self.offset+0x18])[0]+0x14
-    def smooth_index_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x18:self.offset+0x1C])[0]+0x18
-    def smooth_matrix_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x1C:self.offset+0x20])[0]+0x1C
+    
+    def tables(self):
+        item = self.bfres.cache.get(("bone tables", self.offset))
+        if item is None:
+            tables = boneTables(self)
+            item = self.bfres.cache[("bone tables", self.offset)] = (tables, tables.ranges)
+        return item[0]
     
     def get_bone_data(self, i, listorder = False):
-        if listorder:
-            offset = self.bone_index_group_offset()
-            pointer_offset = offset+0x24+i*0x10
-            offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-            return bone(offset, self, self.bfres)
-        else:
-            for j in range(self.num_bones()):
-                offset = self.bone_index_group_offset()
-                pointer_offset = offset+0x24+j*0x10
-                offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-                bn = bone(offset, self, self.bfres)
-                if bn.index() == i:
-                    return bn
+        j = i if listorder else self.tables().order.get(i)
+        if j is None: return None
+        return self.bfres.handle(bone, self.bfres.index_group(self.bone_index_group_offset()).data_offset(j), self)
     
     def get_bone_name(self, i, listorder = False):
         if listorder:
-            offset = self.bone_index_group_offset()
-            name_pointer_offset = offset+0x20+i*0x10
-            name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-            size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-            return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
-        else:
-            for j in range(self.num_bones()):
-                offset = self.bone_index_group_offset()
-                pointer_offset = offset+0x24+j*0x10
-                offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-                bn = bone(offset, self, self.bfres)
-                if bn.index() == i:
-                    offset = self.bone_index_group_offset()
-                    name_pointer_offset = offset+0x20+j*0x10
-                    name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-                    size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-                    return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
+            return self.bfres.index_group(self.bone_index_group_offset()).name(i)
+        j = self.tables().order.get(i)
+        return self.tables().names[j] if j is not None else None
+    
+    def bone_index_by_name(self, name):
+        return self.tables().index_by_name.get(name)
+    
+    def get_smooth_slot(self, i):
+        # First smooth/rigid matrix slot that refers to bone index i.
+        return self.tables().smooth_slot.get(i)
             
     def get_smooth_matrix(self, i):
         offset = self.smooth_matrix_array_offset()+0x30*i
-        return Matrix((struct.unpack(">4f", self.bfres.bytes[offset:offset+0x10]),(struct.unpack(">4f", self.bfres.bytes[offset+0x10:offset+0x20])),(struct.unpack(">4f", self.bfres.bytes[offset+0x20:offset+0x30])),(0,0,0,1)))
+        return Matrix((f32x4.unpack_from(self.bfres.bytes, offset), f32x4.unpack_from(self.bfres.bytes, offset+0x10), f32x4.unpack_from(self.bfres.bytes, offset+0x20), (0,0,0,1)))
     def get_smooth_index(self, i):
         offset = self.smooth_index_array_offset()
-        return struct.unpack(">H", self.bfres.bytes[offset+2*i:offset+2*i+2])[0]
+        return u16.unpack_from(self.bfres.bytes, offset+2*i)[0]
 
+@section
 class FMDL():
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("skeleton_offset", 0xC, "i", POINTER),
+        ("vertex_array_offset", 0x10, "i", POINTER),
+        ("poly_index_group_offset", 0x14, "i", POINTER),
+        ("mat_index_group_offset", 0x18, "i", POINTER),
+        ("total_num_vertices", 0x28, "i", SETTABLE),
+    )
     def __init__(self, offset, bfres):
         self.offset = offset
         self.bfres = bfres
         self.display_info = False
         self.lod = 0
-    def setup_polygon_list(self):
-        self.polygons = {}
-        for pi in range(self.get_polygon_count()):
-            self.polygons[self.get_polygon_name(pi)] = self.get_polygon_data(pi)        
-    def magic(self):
-        return self.bfres.bytes[self.offset:self.offset+4]
-    def skeleton_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0xC:self.offset+0x10])[0]+0xC
-    def vertex_array_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]+0x10
-    def poly_index_group_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x14:self.offset+0x18])[0]+0x14
-    def mat_index_group_offset(self):
-        return self.offset+struct.unpack(">i", self.bfres.bytes[self.offset+0x18:self.offset+0x1C])[0]+0x18
-    def total_num_vertices(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x28] + struct.pack(">i", set) + self.bfres.bytes[self.offset+0x2C:]
-        return struct.unpack(">i", self.bfres.bytes[self.offset+0x28:self.offset+0x2C])[0]
+        self.polygons = sectionMap(bfres, self.poly_index_group_offset, FSHP, self)
+        self.materials = sectionMap(bfres, self.mat_index_group_offset, FMAT, self)
     
     def get_vertex_array(self):
-        return FVTX(self.vertex_array_offset(), self, self.bfres)
+        return self.bfres.handle(FVTX, self.vertex_array_offset(), self)
     
     def get_polygon_count(self):
-        offset = self.poly_index_group_offset()
-        return struct.unpack(">I", self.bfres.bytes[offset+4:offset+8])[0]
+        return len(self.polygons)
 
     def get_material_count(self):
-        offset = self.mat_index_group_offset()
-        return struct.unpack(">I", self.bfres.bytes[offset+4:offset+8])[0]
+        return len(self.materials)
 
     def get_polygon_name(self, i):
-        offset = self.poly_index_group_offset()
-        name_pointer_offset = offset+0x20+i*0x10
-        name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-        size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-        return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
+        return self.polygons.group().name(i)
 
     def get_polygon_data(self, i):
-        offset = self.poly_index_group_offset()
-        pointer_offset = offset+0x24+i*0x10
-        offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-        return FSHP(offset, self, self.bfres)
+        return self.polygons.handle(i)
     
     def get_material_name(self, i):
-        offset = self.mat_index_group_offset()
-        name_pointer_offset = offset+0x20+i*0x10
-        name_offset = name_pointer_offset+struct.unpack(">i", self.bfres.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-        size_of_name = struct.unpack(">i", self.bfres.bytes[name_offset-4:name_offset])[0]
-        return self.bfres.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
+        return self.materials.group().name(i)
 
     def get_material_data(self, i):
-        offset = self.mat_index_group_offset()
-        pointer_offset = offset+0x24+i*0x10
-        offset = pointer_offset+struct.unpack(">i", self.bfres.bytes[pointer_offset:pointer_offset+4])[0]
-        return FMAT(offset, self, self.bfres)
+        return self.materials.handle(i)
     
     def get_skeleton_data(self):
-        return FSKL(self.skeleton_offset(), self, self.bfres)
+        return self.bfres.handle(FSKL, self.skeleton_offset(), self)
            
 
+@section
 class FTEX():
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("surface_dimension", 0x4, "I", VALUE),
+        ("width", 0x8, "I", SETTABLE),
+        ("height", 0xC, "I", SETTABLE),
+        ("depth", 0x10, "I", VALUE),
+        ("num_bitmaps", 0x14, "I", SETTABLE),
+        ("format", 0x18, "I", VALUE),
+        ("aa", 0x1C, "I", VALUE),
+        ("data_length", 0x24, "I", SETTABLE),
+        ("mipmap_data_length", 0x2C, "I", SETTABLE),
+        ("tile_mode", 0x34, "I", VALUE),
+        ("swizzle_value", 0x38, "I", VALUE),
+        ("alignment", 0x3C, "I", VALUE),
+        ("pitch", 0x40, "I", VALUE),
+        ("relative_mipmap_offsets", 0x44, "13I", VALUE),
+        ("num_bitmaps_again", 0x7C, "I", SETTABLE),
+        ("component_selector", 0x88, "4s", VALUE),
+        ("data_offset", 0xB0, "i", POINTER|SETTABLE),
+        ("mipmap_offset", 0xB4, "i", POINTER|SETTABLE),
+    )
     def __init__(self, offset, bfres):
         self.offset = offset
         self.bfres = bfres
         self.display_info = False
-    def magic(self):
-        return self.bfres.bytes[self.offset:self.offset+4]
-    def surface_dimension(self):return struct.unpack(">I", self.bfres.bytes[self.offset+4:self.offset+8])[0]
     def surface_dimension_string(self):
-        sd = struct.unpack(">I", self.bfres.bytes[self.offset:self.offset+4])[0]
+        sd = self.surface_dimension()
         return  "GX2_SURFACE_DIM_1D"            if sd == 0x000 else \
                 "GX2_SURFACE_DIM_2D"            if sd == 0x001 else \
                 "GX2_SURFACE_DIM_3D"            if sd == 0x002 else \
@@ -647,28 +825,6 @@ class FTEX():
                 "GX2_SURFACE_DIM_2D_ARRAY"      if sd == 0x005 else \
                 "GX2_SURFACE_DIM_2D_MSAA"       if sd == 0x006 else \
                 "GX2_SURFACE_DIM_2D_MSAA_ARRAY" if sd == 0x007 else "unknown"
-    def width(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+8] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0xC:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+8:self.offset+0xC])[0]
-    def height(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0xC] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x10:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0xC:self.offset+0x10])[0]
-    def depth(self):
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x10:self.offset+0x14])[0]
-
-    def num_bitmaps(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x14] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x18:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x14:self.offset+0x18])[0]
-    def num_bitmaps_again(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x7C] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x80:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x7C:self.offset+0x80])[0]
-
-    def format(self):return struct.unpack(">I", self.bfres.bytes[self.offset+0x18:self.offset+0x1C])[0]
-
     def format_string(self):
         fmt = self.format()
         return "GX2_SURFACE_FORMAT_INVALID"           if fmt == 0x00000000 else \
@@ -740,19 +896,6 @@ class FTEX():
         "GX2_SURFACE_FORMAT_T_BC5_SNORM"              if fmt == 0x00000235 else \
         "GX2_SURFACE_FORMAT_T_NV12_UNORM"             if fmt == 0x00000081 else \
         "GX2_SURFACE_FORMAT_LAST"                     if fmt == 0x0000083f else "unknown"
-    def aa(self):return struct.unpack(">I", self.bfres.bytes[self.offset+0x1C:self.offset+0x20])[0]
-    
-    def data_length(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x24] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x28:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x24:self.offset+0x28])[0]
-
-    def mipmap_data_length(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x2C] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x30:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x2C:self.offset+0x30])[0]
-
-    def tile_mode(self):return struct.unpack(">I", self.bfres.bytes[self.offset+0x34:self.offset+0x38])[0]
     def tile_mode_string(self):
         tm = self.tile_mode()
         return    "GX2_TILE_MODE_DEFAULT"     if tm == 0x00000000 else \
@@ -773,151 +916,460 @@ class FTEX():
         "GX2_TILE_MODE_3B_TILED_THIN1"        if tm == 0x0000000e else \
         "GX2_TILE_MODE_3B_TILED_THICK"        if tm == 0x0000000f else "unknown"
         
-    def swizzle_value(self):return struct.unpack(">I", self.bfres.bytes[self.offset+0x38:self.offset+0x3C])[0]
-
-    def alignment(self):return struct.unpack(">I", self.bfres.bytes[self.offset+0x3C:self.offset+0x40])[0]
-
-    def pitch(self):return struct.unpack(">I", self.bfres.bytes[self.offset+0x40:self.offset+0x44])[0]
-
     def get_relative_mipmap_offset(self, i, set=None):
         if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0x44+i*4] + struct.pack(">I", set) + self.bfres.bytes[self.offset+0x48+i*4:]
-        return struct.unpack(">I", self.bfres.bytes[self.offset+0x44+i*4:self.offset+0x48+i*4])[0]
+            self.bfres.write(self.offset+0x44+i*4, ">I", set)
+        return u32.unpack_from(self.bfres.bytes, self.offset+0x44+i*4)[0]
 
-    def get_component_selector(self):return self.bfres.bytes[self.offset+0x88:self.offset+0x8C]
+    def get_component_selector(self):return self.component_selector()
 
-    def data_offset(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0xB0] + struct.pack(">i", set-(self.offset+0xB0)) + self.bfres.bytes[self.offset+0xB4:]
-        return self.offset+0xB0+struct.unpack(">i", self.bfres.bytes[self.offset+0xB0:self.offset+0xB4])[0]
+    def image_view(self):
+        return self.bfres.view(self.data_offset(), self.data_length())
+
+    def mipmap_view(self):
+        if not (self.mipmap_offset() and self.mipmap_data_length()):
+            return memoryview(b"")
+        return self.bfres.view(self.mipmap_offset(), self.mipmap_data_length())
 
-    def mipmap_offset(self, set=None):
-        if set is not None:
-            self.bfres.bytes = self.bfres.bytes[:self.offset+0xB4] + struct.pack(">i", set-(self.offset+0xB4)) + self.bfres.bytes[self.offset+0xB8:]
-        return self.offset+0xB4+struct.unpack(">i", self.bfres.bytes[self.offset+0xB4:self.offset+0xB8])[0]
 
+class BFRESjournal():
+    # Ordered (offset, old, new) byte ranges applied over the image, grouped into runs.
+    # Each run also keeps the extra data list from before and after it, so undoing a
+    # run puts relocated buffers back as well.
+    def __init__(self):
+        self.entries = []
+        self.runs = []
+        self.undone = []
+        self.open_run = None
+    def record(self, offset, old, new):
+        self.entries.append((offset, old, new))
+        self.undone = []
+    def begin(self, label, extra_data):
+        self.open_run = {"label": label, "start": len(self.entries), "before": extra_data}
+        self.runs.append(self.open_run)
+    def end(self, extra_data):
+        if self.open_run is not None:
+            self.open_run["after"] = extra_data
+            self.open_run = None
+    def snapshot(self):
+        return len(self.runs)
+
+class rangeCache():
+    # Values parsed out of the image as key -> (value, ranges read from). An entry is dropped as soon
+    # as a write overlaps one of its ranges. Ranges are filed under the 4 KiB buckets they touch, so a
+    # write only compares against the ranges near it. Ranges over more than 16 buckets (the string
+    # pool, big buffers) go on a short list that every write checks instead.
+    bucket_bits = 12
+    wide_buckets = 16
+    def __init__(self):
+        self.items = {}
+        self.buckets = {}
+        self.wide = {}
+    def get(self, key, default=None):
+        return self.items.get(key, default)
+    def __getitem__(self, key):
+        return self.items[key]
+    def __setitem__(self, key, item):
+        self.discard(key)
+        self.items[key] = item
+        for s, e in item[1]:
+            if e <= s: continue
+            first, last = s >> self.bucket_bits, (e-1) >> self.bucket_bits
+            if last-first >= self.wide_buckets:
+                self.wide.setdefault(key, []).append((s, e))
+                continue
+            for b in range(first, last+1):
+                self.buckets.setdefault(b, {}).setdefault(key, []).append((s, e))
+    def __len__(self):
+        return len(self.items)
+    def discard(self, key):
+        item = self.items.pop(key, None)
+        if item is None: return
+        self.wide.pop(key, None)
+        for s, e in item[1]:
+            if e <= s: continue
+            for b in range(s >> self.bucket_bits, ((e-1) >> self.bucket_bits)+1):
+                ranges = self.buckets.get(b)
+                if ranges is None: continue
+                ranges.pop(key, None)
+                if not ranges: del self.buckets[b]
+    def invalidate(self, start, end):
+        if end <= start: return
+        first, last = start >> self.bucket_bits, (end-1) >> self.bucket_bits
+        if last-first < len(self.buckets):
+            groups = [self.buckets[b] for b in range(first, last+1) if b in self.buckets]
+        else:
+            groups = [ranges for b, ranges in self.buckets.items() if first <= b <= last]
+        groups.append(self.wide)
+        stale = set()
+        for ranges in groups:
+            for key, key_ranges in ranges.items():
+                if key not in stale and any(s < end and start < e for s, e in key_ranges):
+                    stale.add(key)
+        for key in stale:
+            self.discard(key)
+
+# Flags word of an extra data trailer record.
+EXTRA_DATA_RESIDENT = 1
+
+class extraData():
+    # Buffers that outgrew their original slot, by id (the offset of the section owning them)
+    # in placement order. Resident items were placed inside an original region freed by an
+    # earlier relocation, the others are laid out in the trailer after size().
+    # free is the sorted list of (offset, size) original regions nobody uses anymore.
+    def __init__(self):
+        self.items = collections.OrderedDict()
+        self.free = []
+    def __iter__(self):
+        return iter(list(self.items.values()))
+    def __len__(self):
+        return len(self.items)
+    def get(self, id):
+        return self.items.get(id)
+    def add(self, item):
+        self.items[item["id"]] = item
+    def remove(self, id):
+        return self.items.pop(id, None)
+    def copy(self):
+        other = extraData()
+        for item in self.items.values():
+            other.add(dict(item, pointers=list(item["pointers"])))
+        other.free = list(self.free)
+        return other
+    def rebuild_free(self):
+        self.free = []
+        for item in self.items.values():
+            self.release_region(item["orig_data_offset"], item["orig_data_size"])
+        for item in self.items.values():
+            if item["resident"]:
+                self.take_region(item["data_offset"], len(item["data"]))
+    def release_region(self, offset, size):
+        if size <= 0: return
+        i = bisect.bisect_left(self.free, (offset, size))
+        end = offset+size
+        # Merge with the neighbours it touches or overlaps.
+        while i > 0 and self.free[i-1][0]+self.free[i-1][1] >= offset:
+            i -= 1
+            offset = min(offset, self.free[i][0])
+            end = max(end, self.free[i][0]+self.free[i][1])
+            del self.free[i]
+        while i < len(self.free) and self.free[i][0] <= end:
+            end = max(end, self.free[i][0]+self.free[i][1])
+            del self.free[i]
+        self.free.insert(i, (offset, end-offset))
+    def take_region(self, offset, size):
+        # Removes [offset, offset+size) from the free list, only if it is entirely free.
+        i = bisect.bisect_right(self.free, (offset, float("inf")))-1
+        if i < 0: return False
+        free_offset, free_size = self.free[i]
+        if offset+size > free_offset+free_size: return False
+        rest = []
+        if offset > free_offset: rest.append((free_offset, offset-free_offset))
+        if free_offset+free_size > offset+size: rest.append((offset+size, free_offset+free_size-offset-size))
+        self.free[i:i+1] = rest
+        return True
+    def allocate(self, size, align):
+        # First fit, returns None when no free region is large enough.
+        for free_offset, free_size in self.free:
+            offset = free_offset+(-free_offset%align)
+            if offset+size <= free_offset+free_size:
+                self.take_region(offset, size)
+                return offset
+        return None
+
+@section
 class BFRES():
-    def __init__(self, filepath, data = None):
-        if filepath is not None:
+    fields = (
+        ("magic", 0x0, "4s", VALUE),
+        ("size", 0xC, "I", VALUE),
+        ("string_table_length", 0x18, "I", VALUE),
+        ("string_table_offset", 0x1C, "i", POINTER),
+        ("model_index_group_offset", 0x20, "i", POINTER),
+        ("texture_index_group_offset", 0x24, "i", POINTER),
+        ("skeleton_animation_index_group_offset", 0x28, "i", POINTER),
+        ("shader_parameters_index_group_offset", 0x2C, "i", POINTER),
+        ("color_animation_index_group_offset", 0x30, "i", POINTER),
+        ("texture_srt_animation_index_group_offset", 0x34, "i", POINTER),
+        ("texture_pattern_animation_index_group_offset", 0x38, "i", POINTER),
+        ("bone_visibility_animation_index_group_offset", 0x3C, "i", POINTER),
+        ("material_visibility_animation_index_group_offset", 0x40, "i", POINTER),
+        ("shape_animation_index_group_offset", 0x44, "i", POINTER),
+        ("scene_animation_index_group_offset", 0x48, "i", POINTER),
+        ("embedded_file_index_group_offset", 0x4C, "i", POINTER),
+        ("model_index_group_count", 0x50, "H", VALUE),
+        ("texture_index_group_count", 0x52, "H", VALUE),
+        ("skeleton_animation_index_group_count", 0x54, "H", VALUE),
+        ("shader_parameters_index_group_count", 0x56, "H", VALUE),
+        ("color_animation_index_group_count", 0x58, "H", VALUE),
+        ("texture_srt_animation_index_group_count", 0x5A, "H", VALUE),
+        ("texture_pattern_animation_index_group_count", 0x5C, "H", VALUE),
+        ("bone_visibility_animation_index_group_count", 0x5E, "H", VALUE),
+        ("material_visibility_animation_index_group_count", 0x60, "H", VALUE),
+        ("shape_animation_index_group_count", 0x62, "H", VALUE),
+        ("scene_animation_index_group_count", 0x64, "H", VALUE),
+        ("embedded_file_index_group_count", 0x66, "H", VALUE),
+    )
+    offset = 0
+    def __init__(self, filepath, data = None, use_mmap = False):
+        # The header is read through the same field accessors as the sections inside it.
+        self.bfres = self
+        self.filepath = filepath
+        self.mapped = use_mmap and filepath is not None
+        if self.mapped:
+            self.map_file(filepath)
+        elif filepath is not None:
             f = open(filepath, "rb")
-            self.bytes = f.read()
+            self.bytes = bytearray(os.path.getsize(filepath))
+            f.readinto(self.bytes)
             f.close()
         else:
-            self.bytes = data
-        self.orig_bytes = self.bytes
-        self.extra_data = []
+            self.bytes = bytearray(data)
+        self.cache = rangeCache()
+        self.journal = BFRESjournal()
+        self.read_extra_data()
+        self.handles = {}
+        self.textures = sectionMap(self, lambda: self.texture_index_group_offset() if self.texture_index_group_count() else None, FTEX)
+        self.models = sectionMap(self, lambda: self.model_index_group_offset() if self.model_index_group_count() else None, FMDL)
+    def map_file(self, filepath):
+        # Reads come straight from the page cache, edits land in private copy-on-write pages.
+        f = open(filepath, "rb")
+        self.bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.orig_bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+    def make_resizable(self):
+        if type(self.bytes) is not bytearray:
+            self.bytes = bytearray(self.bytes)
+    def read_extra_data(self):
+        # Trailer records are 8 words: id, data size, data offset, pointer count, original size,
+        # original offset, flags and one spare, followed by (pointer offset, data offset) pairs.
+        # A resident record's data is inside the file, the others' data follows the record.
+        self.extra_data = extraData()
         ei = self.size()
-        while ei < len(self.bytes):
-            extra_values = struct.unpack(">8I", self.bytes[ei:ei+0x20])
+        while ei+0x20 <= len(self.bytes):
+            extra_values = struct.unpack_from(">8I", self.bytes, ei)
             pointers = []
             for pi in range(extra_values[3]):
-                pointer_values = struct.unpack(">2I", self.bytes[ei+0x20+pi*8:ei+0x28+pi*8])
+                pointer_values = struct.unpack_from(">2I", self.bytes, ei+0x20+pi*8)
                 pointers.append({"pointer_offset": pointer_values[0], "data_offset": pointer_values[1]})
-            ei = extra_values[2]
-            self.extra_data.append({"id": extra_values[0], "data": self.bytes[ei:ei+extra_values[1]], "orig_data_size": extra_values[4], "orig_data_offset": extra_values[5], "pointers": pointers})
-            ei+=extra_values[1]
-        self.textures = {}
-        for ti in range(self.texture_index_group_count()):
-            self.textures[self.get_texture_name(ti)] = self.get_texture_data(ti)
-        self.models = {}
-        for mi in range(self.model_index_group_count()):
-            mdl = self.get_model_data(mi)
-            mdl.setup_polygon_list()
-            self.models[self.get_model_name(mi)] = mdl
+            resident = (extra_values[6]&EXTRA_DATA_RESIDENT) != 0
+            data_offset = extra_values[2]
+            self.extra_data.add({"id": extra_values[0], "data": bytes(self.bytes[data_offset:data_offset+extra_values[1]]), "orig_data_size": extra_values[4], "orig_data_offset": extra_values[5], "pointers": pointers, "resident": resident, "data_offset": data_offset})
+            ei = ei+0x20+extra_values[3]*8 if resident else data_offset+extra_values[1]
+        self.extra_data.rebuild_free()
+    
+    def begin_edit(self, label):
+        self.journal.end(self.extra_data.copy())
+        self.journal.begin(label, self.extra_data.copy())
+    def end_edit(self):
+        self.journal.end(self.extra_data.copy())
+    def can_undo(self):
+        return len(self.journal.runs) > 0
+    def can_redo(self):
+        return len(self.journal.undone) > 0
+    def undo(self):
+        self.end_edit()
+        run = self.journal.runs.pop()
+        entries = self.journal.entries[run["start"]:]
+        del self.journal.entries[run["start"]:]
+        for offset, old, new in reversed(entries):
+            self.splice(offset, len(new), old)
+        self.extra_data = run["before"].copy()
+        run["entries"] = entries
+        self.journal.undone.append(run)
+    def redo(self):
+        run = self.journal.undone.pop()
+        run["start"] = len(self.journal.entries)
+        for offset, old, new in run.pop("entries"):
+            self.splice(offset, len(old), new)
+            self.journal.entries.append((offset, old, new))
+        self.extra_data = run["after"].copy()
+        self.journal.runs.append(run)
+    def rollback(self, snapshot):
+        while len(self.journal.runs) > snapshot:
+            self.undo()
+        self.journal.undone = []
+    def original_bytes(self):
+        if self.mapped:
+            return self.orig_bytes
+        image = bytearray(self.bytes)
+        for offset, old, new in reversed(self.journal.entries):
+            image[offset:offset+len(new)] = old
+        return image
+    def restore(self):
+        self.rollback(0)
+    def save(self, filepath):
+        self.end_edit()
+        data = self.bytes
+        if self.mapped:
+            # The target may be the mapped file itself, so copy out before unmapping.
+            data = bytes(self.bytes)
+            if type(self.bytes) is not bytearray: self.bytes.close()
+            self.orig_bytes.close()
+        f = open(filepath, "wb")
+        f.write(data)
+        f.close()
+        if self.mapped:
+            self.filepath = filepath
+            self.map_file(filepath)
+        self.journal = BFRESjournal()
+    def extra_data_layout(self, size):
+        # (record offset, data offset) of every extra data item laid out after size(), and the end of the file.
+        # Resident items only take up their record, their data stays where it was placed.
+        layout = []
+        end = size
+        for item in self.extra_data:
+            record_offset = end
+            end += 0x20+len(item["pointers"])*8
+            if item["resident"]:
+                layout.append((record_offset, item["data_offset"]))
+                continue
+            end += -end%0x40
+            layout.append((record_offset, end))
+            end += len(item["data"])
+        return layout, end
     def apply_extra_data(self):
-        self.bytes = self.bytes[:self.size()]
-        for pi in range(len(self.extra_data)):
-            ___data_ptr_offset = len(self.bytes) + 0x8
-            self.bytes += struct.pack(">IIIIIIII", self.extra_data[pi]["id"], len(self.extra_data[pi]["data"]), 0, len(self.extra_data[pi]["pointers"]), self.extra_data[pi]["orig_data_size"], self.extra_data[pi]["orig_data_offset"], 0, 0)
-            for pointer in self.extra_data[pi]["pointers"]:
-                self.bytes += struct.pack(">II", pointer["pointer_offset"], pointer["data_offset"])
-            while (len(self.bytes)%0x40) != 0:
-                self.bytes += b'\0'
-            data_offset = len(self.bytes)
-            self.bytes = self.bytes[:___data_ptr_offset] + struct.pack(">I", data_offset) + self.bytes[___data_ptr_offset+4:] + self.extra_data[pi]["data"]
-            for pointer in self.extra_data[pi]["pointers"]:
-                self.bytes = self.bytes[:pointer["pointer_offset"]] + struct.pack(">i", pointer["data_offset"]+data_offset-pointer["pointer_offset"]) + self.bytes[pointer["pointer_offset"]+4:]
-            self.extra_data[pi]["data_offset"] = data_offset
+        size = self.size()
+        layout, end = self.extra_data_layout(size)
+        tail = bytearray(end-size)
+        for item, (record_offset, data_offset) in zip(self.extra_data, layout):
+            o = record_offset-size
+            flags = EXTRA_DATA_RESIDENT if item["resident"] else 0
+            struct.pack_into(">8I", tail, o, item["id"], len(item["data"]), data_offset, len(item["pointers"]), item["orig_data_size"], item["orig_data_offset"], flags, 0)
+            for pi, pointer in enumerate(item["pointers"]):
+                struct.pack_into(">II", tail, o+0x20+pi*8, pointer["pointer_offset"], pointer["data_offset"])
+            if not item["resident"]:
+                tail[data_offset-size:data_offset-size+len(item["data"])] = item["data"]
+            item["data_offset"] = data_offset
+        # Every record, data block and the padding between them is replaced on its own, so the
+        # journal only keeps what changed. The image is only grown or cut at the very end.
+        common = min(end, len(self.bytes))
+        bounds = set([size, common])
+        for item, (record_offset, data_offset) in zip(self.extra_data, layout):
+            bounds.update((record_offset, record_offset+0x20+len(item["pointers"])*8))
+            if not item["resident"]:
+                bounds.update((data_offset, data_offset+len(item["data"])))
+        bounds = sorted(b for b in bounds if size <= b <= common)
+        for start, stop in zip(bounds, bounds[1:]):
+            self.replace(start, stop-start, tail[start-size:stop-size])
+        if end > common:
+            self.replace(common, 0, tail[common-size:])
+        elif len(self.bytes) > common:
+            self.replace(common, len(self.bytes)-common, b"")
+        for item in self.extra_data:
+            for pointer in item["pointers"]:
+                self.write(pointer["pointer_offset"], ">i", pointer["data_offset"]+item["data_offset"]-pointer["pointer_offset"])
+    def place_extra_data(self, id, data, orig_data_offset, orig_data_size, pointers, align=0x40):
+        # Writes a rebuilt buffer back into its own slot when it fits. Otherwise its slot is freed
+        # and the buffer goes into the first freed region that fits, or to the trailer.
+        # Returns the new extra data item, or None when the buffer went back into its own slot.
+        item = self.extra_data.remove(id)
+        if item is not None and item["resident"]:
+            self.extra_data.release_region(item["data_offset"], len(item["data"]))
+        own_slot = item is None or self.extra_data.take_region(orig_data_offset, orig_data_size)
+        if own_slot and len(data) <= orig_data_size:
+            self.write_bytes(orig_data_offset, data)
+            for pointer in pointers:
+                self.write(pointer["pointer_offset"], ">i", orig_data_offset+pointer["data_offset"]-pointer["pointer_offset"])
+            return None
+        if own_slot:
+            self.extra_data.release_region(orig_data_offset, orig_data_size)
+        data_offset = self.extra_data.allocate(len(data), align)
+        if data_offset is not None:
+            self.write_bytes(data_offset, data)
+        item = {"id": id, "data": bytes(data), "orig_data_size": orig_data_size, "orig_data_offset": orig_data_offset, "pointers": pointers, "resident": data_offset is not None, "data_offset": data_offset}
+        self.extra_data.add(item)
+        return item
+    def splice(self, offset, length, data):
+        if len(data) != length:
+            self.make_resizable()
+            self.invalidate(offset, max(len(self.bytes), offset+len(data)))
+        else:
+            self.invalidate(offset, offset+length)
+        self.bytes[offset:offset+length] = data
+    def invalidate(self, start, end):
+        self.cache.invalidate(start, end)
+    def string_table(self):
+        # The string pool decoded in one pass: offset of the characters -> interned str.
+        # Each entry is a u32 length, the characters, a null byte and padding to 4 bytes.
+        item = self.cache.get("string table")
+        if item is None:
+            table = {}
+            start = self.string_table_offset()
+            end = min(start+self.string_table_length(), len(self.bytes))
+            if not self.is_string_entry(start, end): start -= 4
+            offset = start
+            while self.is_string_entry(offset, end):
+                size = u32.unpack_from(self.bytes, offset)[0]
+                try:
+                    table[offset+4] = intern(self.bytes[offset+4:offset+4+size].decode("UTF-8"))
+                except UnicodeDecodeError:
+                    break
+                offset = (offset+4+size+1+3)&~3
+            item = self.cache["string table"] = (table, [(start, end)])
+        return item[0]
+    def is_string_entry(self, offset, end):
+        if offset < 0 or offset+4 > end: return False
+        size = u32.unpack_from(self.bytes, offset)[0]
+        return offset+4+size < end and self.bytes[offset+4+size] == 0
+    def string(self, offset):
+        # Names that are not in the scanned pool are decoded on demand and cached on their own.
+        name = self.string_table().get(offset)
+        if name is None:
+            item = self.cache.get(("string", offset))
+            if item is None:
+                size = s32.unpack_from(self.bytes, offset-4)[0]
+                name = intern(self.bytes[offset:offset+size].decode("UTF-8"))
+                item = self.cache[("string", offset)] = (name, [(offset-4, offset+size)])
+            name = item[0]
+        return name
+    def handle(self, cls, offset, parent=None):
+        # One handle per section, so state kept on it (display_info, lod) survives lookups.
+        item = self.handles.get((cls, offset))
+        if item is None:
+            item = cls(offset, self) if parent is None else cls(offset, parent, self)
+            self.handles[(cls, offset)] = item
+        return item
+    def index_group(self, offset):
+        item = self.cache.get(("index group", offset))
+        if item is None:
+            group = indexGroup(self, offset)
+            item = self.cache[("index group", offset)] = (group, group.ranges)
+        return item[0]
+    def replace(self, offset, length, data):
+        old = bytes(self.bytes[offset:offset+length])
+        if old == data: return
+        if self.journal.open_run is None:
+            self.journal.begin("Edit", self.extra_data.copy())
+        self.journal.record(offset, old, bytes(data))
+        self.splice(offset, len(old), data)
+    def write(self, offset, fmt, *values):
+        data = struct.pack(fmt, *values)
+        self.replace(offset, len(data), data)
+    def write_bytes(self, offset, data):
+        self.replace(offset, len(data), data)
+    def view(self, offset, size):
+        # A read-only window onto the image, nothing is copied. Relocated buffers are seen where
+        # their pointers lead after apply_extra_data. A bytearray image can't be resized while
+        # a view onto it is alive, so views shouldn't be kept across edits.
+        size = max(0, min(size, len(self.bytes)-offset))
+        if size == 0:
+            return memoryview(b"")
+        window = numpy.frombuffer(self.bytes, numpy.uint8, size, offset)
+        window.flags.writeable = False
+        return memoryview(window)
             
                 
-    def magic(self):
-        return self.bytes[:4]
-    def size(self):
-        return struct.unpack(">I", self.bytes[0xC:0x10])[0]
-    def model_index_group_offset(self):
-        return 0x20+struct.unpack(">i", self.bytes[0x20:0x24])[0]
-    def texture_index_group_offset(self):
-        return 0x24+struct.unpack(">i", self.bytes[0x24:0x28])[0]
-    def skeleton_animation_index_group_offset(self):
-        return 0x28+struct.unpack(">i", self.bytes[0x28:0x2C])[0]
-    def shader_parameters_index_group_offset(self):
-        return 0x2C+struct.unpack(">i", self.bytes[0x2C:0x30])[0]
-    def color_animation_index_group_offset(self):
-        return 0x30+struct.unpack(">i", self.bytes[0x30:0x34])[0]
-    def texture_srt_animation_index_group_offset(self):
-        return 0x34+struct.unpack(">i", self.bytes[0x34:0x38])[0]
-    def texture_pattern_animation_index_group_offset(self):
-        return 0x38+struct.unpack(">i", self.bytes[0x38:0x3C])[0]
-    def bone_visibility_animation_index_group_offset(self):
-        return 0x3C+struct.unpack(">i", self.bytes[0x3C:0x40])[0]
-    def material_visibility_animation_index_group_offset(self):
-        return 0x40+struct.unpack(">i", self.bytes[0x40:0x44])[0]
-    def shape_animation_index_group_offset(self):
-        return 0x44+struct.unpack(">i", self.bytes[0x44:0x48])[0]
-    def scene_animation_index_group_offset(self):
-        return 0x48+struct.unpack(">i", self.bytes[0x48:0x4C])[0]
-    def embedded_file_index_group_offset(self):
-        return 0x4C+struct.unpack(">i", self.bytes[0x4C:0x50])[0]
-    def model_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x50:0x52])[0]
-    def texture_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x52:0x54])[0]
-    def skeleton_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x54:0x56])[0]
-    def shader_parameters_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x56:0x58])[0]
-    def color_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x58:0x5A])[0]
-    def texture_srt_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x5A:0x5C])[0]
-    def texture_pattern_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x5C:0x5E])[0]
-    def bone_visibility_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x5E:0x60])[0]
-    def material_visibility_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x60:0x62])[0]
-    def shape_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x62:0x64])[0]
-    def scene_animation_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x64:0x66])[0]
-    def embedded_file_index_group_count(self):
-        return struct.unpack(">H", self.bytes[0x66:0x68])[0]
-    
     def get_model_name(self, i):
-        offset = self.model_index_group_offset()
-        name_pointer_offset = offset+0x20+i*0x10
-        name_offset = name_pointer_offset+struct.unpack(">i", self.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-        size_of_name = struct.unpack(">i", self.bytes[name_offset-4:name_offset])[0]
-        return self.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
+        return self.models.group().name(i)
     
     def get_model_data(self, i):
-        offset = self.model_index_group_offset()
-        pointer_offset = offset+0x24+i*0x10
-        offset = pointer_offset+struct.unpack(">i", self.bytes[pointer_offset:pointer_offset+4])[0]
-        return FMDL(offset, self)
+        return self.models.handle(i)
     
     def get_texture_name(self, i):
-        offset = self.texture_index_group_offset()
-        name_pointer_offset = offset+0x20+i*0x10
-        name_offset = name_pointer_offset+struct.unpack(">i", self.bytes[name_pointer_offset:name_pointer_offset+4])[0]
-        size_of_name = struct.unpack(">i", self.bytes[name_offset-4:name_offset])[0]
-        return self.bytes[name_offset:name_offset+size_of_name].decode("UTF-8")
+        return self.textures.group().name(i)
     
     def get_texture_data(self, i):
-        offset = self.texture_index_group_offset()
-        pointer_offset = offset+0x24+i*0x10
-        offset = pointer_offset+struct.unpack(">i", self.bytes[pointer_offset:pointer_offset+4])[0]
-        return FTEX(offset, self)
+        return self.textures.handle(i)
     
 ###############################################################################################
 # _parse_3x_10bit_signed ported from io_scene_bfres/src/bfres_fmdl.py by Github user RayKoopa #
@@ -937,6 +1389,201 @@ def _encode_3x_10bit_signed(x,y,z):
             outY = (int((((((y+1)/2))-0.5)/2)*511) << 12) & 0x000FF000
             outZ = (int((((((z+1)/2))-0.5)/2)*511) << 2) & 0x000003FC
             return struct.pack(">I", outX|outY|outZ)
+def _parse_3x_10bit_signed_array(integers):
+    # _parse_3x_10bit_signed over an array of words, (N, 3) float64 out with the same rounding.
+    integers = numpy.asarray(integers).astype(numpy.uint32)
+    xyz = numpy.empty((len(integers), 3))
+    for c, shift in enumerate((22, 12, 2)):
+        xyz[:, c] = ((((integers >> shift) & 0xFF) / 511*2+0.5)%1)*2-1
+    return xyz
+def _encode_3x_10bit_signed_array(xyz):
+    # _encode_3x_10bit_signed over an (N, 3) array, uint32 words out.
+    xyz = numpy.asarray(xyz, numpy.float64)
+    q = numpy.trunc(((((xyz+1)/2))-0.5)/2*511).astype(numpy.int64)
+    return (((q[:, 0] << 22) & 0x3FC00000) | ((q[:, 1] << 12) & 0x000FF000) | ((q[:, 2] << 2) & 0x000003FC)).astype(numpy.uint32)
+
+# numpy type, component count and the divisor mapping it to [0, 1] or [-1, 1] of each attribute format.
+attribute_formats = {
+    "unorm_8": ("u1", 1, 0xFF),
+    "unorm_8_8": ("u1", 2, 0xFF),
+    "unorm_16_16": (">u2", 2, 0xFFFF),
+    "unorm_8_8_8_8": ("u1", 4, 0xFF),
+    "uint_8": ("u1", 1, None),
+    "uint_8_8": ("u1", 2, None),
+    "uint_8_8_8_8": ("u1", 4, None),
+    "snorm_8": ("i1", 1, 0x7F),
+    "snorm_8_8": ("i1", 2, 0x7F),
+    "snorm_16_16": (">i2", 2, 0x7FFF),
+    "snorm_8_8_8_8": ("i1", 4, 0x7F),
+    "snorm_10_10_10_2": (">u4", 1, None),
+    "sint_8": ("i1", 1, None),
+    "sint_8_8": ("i1", 2, None),
+    "sint_8_8_8_8": ("i1", 4, None),
+    "float_32": (">f4", 1, None),
+    "float_16_16": (">f2", 2, None),
+    "float_32_32": (">f4", 2, None),
+    "float_16_16_16_16": (">f2", 4, None),
+    "float_32_32_32": (">f4", 3, None),
+    "float_32_32_32_32": (">f4", 4, None),
+}
+def decode_values(fmt, values):
+    # Raw (N, C) values of an attribute format to float32.
+    scale = attribute_formats[fmt][2]
+    if fmt == "snorm_10_10_10_2":
+        return _parse_3x_10bit_signed_array(values[:, 0]).astype(numpy.float32)
+    out = values.astype(numpy.float32)
+    if scale is not None:
+        out /= scale
+        if fmt.startswith("snorm"):
+            numpy.maximum(out, -1, out)
+    return out
+def encode_values(fmt, values):
+    # (N, K) values to the raw (N, C) values of an attribute format as the exporter writes them, with
+    # a mask of the rows that fall outside the format's range. None, None for formats it can't write.
+    if fmt not in ("float_16_16_16_16", "float_16_16", "float_32_32_32", "float_32_32", "snorm_10_10_10_2", "snorm_16_16", "uint_8", "uint_8_8", "uint_8_8_8_8", "unorm_8_8", "unorm_16_16", "unorm_8_8_8_8"):
+        return None, None
+    type_, count, scale = attribute_formats[fmt]
+    values = numpy.asarray(values, numpy.float64)
+    if values.ndim < 2:
+        # No values at all (a shape without triangles) or one component per vertex.
+        values = values.reshape(len(values), -1 if len(values) else 0)
+    fitted = numpy.zeros((len(values), 3 if fmt == "snorm_10_10_10_2" else count))
+    c = min(fitted.shape[1], values.shape[1])
+    fitted[:, :c] = values[:, :c]
+    bad = numpy.zeros(len(values), bool)
+    if fmt == "snorm_10_10_10_2":
+        return _encode_3x_10bit_signed_array(fitted[:, ::-1])[:, None].astype(type_), bad
+    if fmt == "float_16_16_16_16":
+        fitted[:, 3] = 0
+    elif fmt == "snorm_16_16":
+        fitted = numpy.round(fitted/2*0xffff)
+        fitted[fitted >= 0x8000] -= 0x10000
+        bad = ((fitted < -0x8000) | (fitted >= 0x8000)).any(1)
+    elif fmt.startswith("uint"):
+        bad = ((fitted < 0) | (fitted > 0xFF)).any(1)
+    elif fmt.startswith("unorm"):
+        fitted = numpy.round(fitted*scale)
+        bad = ((fitted < 0) | (fitted > scale)).any(1)
+    fitted[bad] = 0
+    return fitted.astype(type_), bad
+
+# numpy type of each GX2 index format.
+index_formats = {
+    0: "<u2", # GX2_INDEX_FORMAT_U16_LE
+    1: "<u4", # GX2_INDEX_FORMAT_U32_LE
+    4: ">u2", # GX2_INDEX_FORMAT_U16
+    9: ">u4", # GX2_INDEX_FORMAT_U32
+}
+def _triangles(indices):
+    return indices[:len(indices)//3*3].reshape(-1, 3)
+def _triangle_strip(indices):
+    if len(indices) < 3: return numpy.empty((0, 3), numpy.int64)
+    faces = numpy.stack((indices[:-2], indices[1:-1], indices[2:]), 1)
+    # Every other triangle is flipped to keep the winding.
+    faces[1::2, 0], faces[1::2, 1] = indices[2:-1:2], indices[1:-2:2]
+    return faces
+def _triangle_fan(indices):
+    if len(indices) < 3: return numpy.empty((0, 3), numpy.int64)
+    return numpy.stack((numpy.full(len(indices)-2, indices[0], numpy.int64), indices[1:-1], indices[2:]), 1)
+def _quads(indices):
+    quads = indices[:len(indices)//4*4].reshape(-1, 4)
+    return quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+# Triangle list from the indices of one primitive, by GX2 primitive type.
+primitive_triangulators = {
+    0x04: _triangles, # GX2_PRIMITIVE_TRIANGLES
+    0x05: _triangle_fan, # GX2_PRIMITIVE_TRIANGLE_FAN
+    0x06: _triangle_strip, # GX2_PRIMITIVE_TRIANGLE_STRIP
+    0x13: _quads, # GX2_PRIMITIVE_QUADS
+}
+
+def clean_faces(faces, shapes, num_vertices):
+    # Drops triangles that a mesh can't hold: out of range, degenerate, or repeating the
+    # vertices of an earlier triangle in any order. The first of the duplicates is kept.
+    keep = (faces >= 0).all(1) & (faces < num_vertices).all(1)
+    keep &= (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces, shapes = faces[keep], shapes[keep]
+    if len(faces) == 0: return faces, shapes
+    corners = numpy.sort(faces, 1)
+    if num_vertices < 1 << 21:
+        # Three indices fit in one int64 key, much faster to unique than rows.
+        corners = (corners[:, 0] << 42) | (corners[:, 1] << 21) | corners[:, 2]
+        first = numpy.unique(corners, return_index=True)[1]
+    else:
+        first = numpy.unique(corners, axis=0, return_index=True)[1]
+    first.sort()
+    return faces[first], shapes[first]
+
+def weld_triangles(mesh, num_materials):
+    # Fans every polygon into triangles and gives each material its own vertex list. An exported
+    # vertex is one (vertex, loop) pair, numbered in the order the triangles first use it.
+    # Returns the per-material triangle indices and the per-material (vertex, loop) lists.
+    loop_start = numpy.empty(len(mesh.polygons), numpy.int32)
+    loop_total = numpy.empty(len(mesh.polygons), numpy.int32)
+    material = numpy.empty(len(mesh.polygons), numpy.int32)
+    loop_vertex = numpy.empty(len(mesh.loops), numpy.int32)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    mesh.polygons.foreach_get("material_index", material)
+    mesh.loops.foreach_get("vertex_index", loop_vertex)
+    # Triangle k of polygon p uses loops start, start+k+1 and start+k+2.
+    count = numpy.maximum(loop_total-2, 0)
+    polygon = numpy.repeat(numpy.arange(len(count)), count)
+    k = numpy.arange(count.sum())-numpy.repeat(numpy.cumsum(count)-count, count)
+    start = loop_start[polygon]
+    loops = numpy.column_stack((start, start+k+1, start+k+2))
+    polygons = []
+    vertex_indexes = []
+    for mt in range(num_materials):
+        corners = loops[material[polygon] == mt].ravel()
+        unique, first, inverse = numpy.unique(corners, return_index=True, return_inverse=True)
+        order = numpy.argsort(first)
+        rank = numpy.empty(len(order), numpy.int64)
+        rank[order] = numpy.arange(len(order))
+        welded = unique[order]
+        polygons.append(rank[inverse].tolist())
+        vertex_indexes.append(list(zip(loop_vertex[welded].tolist(), welded.tolist())))
+    return polygons, vertex_indexes
+
+def vertex_group_table(mesh):
+    # Every (vertex, group, weight) of a mesh as three arrays, from one pass over mesh.vertices[].groups.
+    vertex, group, weight = [], [], []
+    for vi, mv in enumerate(mesh.vertices):
+        for g in mv.groups:
+            vertex.append(vi)
+            group.append(g.group)
+            weight.append(g.weight)
+    return numpy.array(vertex, numpy.int64), numpy.array(group, numpy.int64), numpy.array(weight, numpy.float64)
+
+def skin_influences(table, num_vertices, count=4):
+    # The count heaviest vertex groups of every vertex of a vertex_group_table(), heaviest first with
+    # ties going to the earlier group. Returns (V, count) group indices, -1 where a vertex has fewer
+    # weighted groups, and their weights scaled to add up to 1.
+    vertex, group, weight = table
+    keep = weight > 0
+    vertex, group, weight = vertex[keep], group[keep], weight[keep]
+    order = numpy.lexsort((group, -weight, vertex))
+    vertex, group, weight = vertex[order], group[order], weight[order]
+    rank = numpy.arange(len(vertex))-numpy.searchsorted(vertex, vertex)
+    keep = rank < count
+    groups = numpy.full((num_vertices, count), -1, numpy.int64)
+    weights = numpy.zeros((num_vertices, count))
+    groups[vertex[keep], rank[keep]] = group[keep]
+    weights[vertex[keep], rank[keep]] = weight[keep]
+    total = weights.sum(1)
+    weights[total > 0] /= total[total > 0, None]
+    return groups, weights
+
+def rigid_groups(table, num_vertices, bound):
+    # The vertex group a rigidly skinned vertex follows: the first one, in group order, that weighs
+    # at least 0.5 and that bound (a bool per group) allows. -1 for vertices without one.
+    vertex, group, weight = table
+    keep = (weight >= 0.5) & numpy.asarray(bound, bool)[group]
+    vertex, group = vertex[keep], group[keep]
+    order = numpy.lexsort((group, vertex))
+    found, first = numpy.unique(vertex[order], return_index=True)
+    groups = numpy.full(num_vertices, -1, numpy.int64)
+    groups[found] = group[order][first]
+    return groups
 
 def matrix_from_transform(pos, rot, scale):
     return Matrix.Translation(pos) * rot.to_matrix().to_4x4() * Matrix(((scale[0],0,0,0),(0,scale[1],0,0),(0,0,scale[2],0),(0,0,0,1)))
@@ -3337,33 +3984,21 @@ def SaveBFTEX(ftex, tname, level, img, operator=None):
                 ftex.num_bitmaps_again(level+1)
                 break
     if resize:
-        removeExtDatItems = []
-        for extdatItem in bpy.context.scene.bfres.data.extra_data:
-            if extdatItem["id"] == ftex.offset:
-                total_original_size = extdatItem["orig_data_size"]
-                data_offset = ftex.data_offset(extdatItem["orig_data_offset"])
-                ftex.mipmap_offset(data_offset+base_data_size)
-                removeExtDatItems.append(extdatItem)
-        for extdatItem in removeExtDatItems:
-            bpy.context.scene.bfres.data.extra_data.remove(extdatItem)
+        extdatItem = bpy.context.scene.bfres.data.extra_data.get(ftex.offset)
+        if extdatItem is not None:
+            total_original_size = extdatItem["orig_data_size"]
+            data_offset = extdatItem["orig_data_offset"]
         ftex.mipmap_data_length(len(out_data) - dataSize)
-        if len(out_data) > total_original_size:
-            pointers = []
-            pointers.append({"pointer_offset": ftex.offset+0xB0, "data_offset": 0})
-            pointers.append({"pointer_offset": ftex.offset+0xB4, "data_offset": dataSize})
-            bpy.context.scene.bfres.data.extra_data.append({"id": ftex.offset, "data": out_data, "orig_data_size": total_original_size, "orig_data_offset": data_offset, "pointers": pointers})
-        else:
-            bpy.context.scene.bfres.data.bytes = bpy.context.scene.bfres.data.bytes[:data_offset] + out_data + bpy.context.scene.bfres.data.bytes[data_offset+len(out_data):]
+        pointers = []
+        pointers.append({"pointer_offset": ftex.offset+0xB0, "data_offset": 0})
+        pointers.append({"pointer_offset": ftex.offset+0xB4, "data_offset": dataSize})
+        bpy.context.scene.bfres.data.place_extra_data(ftex.offset, out_data, data_offset, total_original_size, pointers, max(0x40, ftex.alignment()))
     else:
-        inExtra = None
-        for itemID in range(len(bpy.context.scene.bfres.data.extra_data)):
-            if bpy.context.scene.bfres.data.extra_data[itemID]["id"] == ftex.offset:
-                inExtra = (bpy.context.scene.bfres.data.extra_data[itemID].get("data_offset"), itemID)
-        if inExtra is None:
-            bpy.context.scene.bfres.data.bytes = bpy.context.scene.bfres.data.bytes[:data_offset] + out_data + bpy.context.scene.bfres.data.bytes[data_offset+len(out_data):]
-        else:
-            if inExtra[0] is not None:
-                bpy.context.scene.bfres.data.extra_data[inExtra[1]]["data"] = bpy.context.scene.bfres.data.extra_data[inExtra[1]]["data"][:data_offset-inExtra[0]] + out_data + bpy.context.scene.bfres.data.extra_data[inExtra[1]]["data"][data_offset+len(out_data)-inExtra[0]:]
+        extdatItem = bpy.context.scene.bfres.data.extra_data.get(ftex.offset)
+        if extdatItem is None or extdatItem["resident"]:
+            bpy.context.scene.bfres.data.write_bytes(data_offset, out_data)
+        elif extdatItem["data_offset"] is not None:
+            extdatItem["data"] = extdatItem["data"][:data_offset-extdatItem["data_offset"]] + out_data + extdatItem["data"][data_offset+len(out_data)-extdatItem["data_offset"]:]
     bpy.context.scene.bfres.data.apply_extra_data()
     
     
@@ -3393,17 +4028,8 @@ def LoadBFTEX(ftex, tname, level, img=None, pack=False, operator=None):
                     comp = i
                 compSel.append(comp)
 
-            dataSize = ftex.data_length()
-            mipSize = ftex.mipmap_data_length()
-            data_pos = ftex.data_offset()
-            mip_pos = ftex.mipmap_offset()
-
-            data = bpy.context.scene.bfres.data.bytes[data_pos:data_pos+dataSize]
-
-            if not (mip_pos and mipSize):
-                mipData = b""
-            else:
-                mipData = bpy.context.scene.bfres.data.bytes[mip_pos:mip_pos+mipSize]
+            data = ftex.image_view()
+            mipData = ftex.mipmap_view()
 
             numMips = ftex.num_bitmaps()
             width = ftex.width()
@@ -3795,22 +4421,9 @@ def LoadBFTEX(ftex, tname, level, img=None, pack=False, operator=None):
             if pack:
                 img.save()
                 img.pack()
-def get_tess_normal_by_vertex(mesh, vertex_id):
-    r = find_vertex_from_face(mesh, vertex_id)
-    if r is None: return (0,0,0)
-    if r[1] >= len(mesh.tessfaces[r[0]].split_normals):
-        return mesh.vertices[vertex_id].normal
-    return mesh.tessfaces[r[0]].split_normals[r[1]][:]
-
-def find_vertex_from_face(mesh, vertex_id):
-    for pi in range(len(mesh.polygons)):
-        for vi in range(len(mesh.polygons[pi].vertices)):
-            if mesh.polygons[pi].vertices[vi] == vertex_id:
-                return (pi,vi)
-
 def SaveBFMDL_Mesh(fmdl, fmdlname, source_obj, operator = None):
+    source_obj.data.update(calc_edges=True)
     source_obj.data.calc_normals_split()
-    source_obj.data.update(calc_edges=True, calc_tessface=True)
     
     if source_obj.type != 'MESH':
         if operator is not None: operator.report({'ERROR'}, "Source object is a mesh type.")
@@ -3823,29 +4436,57 @@ def SaveBFMDL_Mesh(fmdl, fmdlname, source_obj, operator = None):
         print("\t\t\tError: The selected source object \"%s\" does not hold enough material slots. Please add in %i more slot(s)." % (source_obj.name, numPolys - len(source_obj.material_slots)))
         return
     
-    polygons = [[] for i in range(len(source_obj.material_slots))]
-    
-    vertex_indexes = [[] for i in range(len(source_obj.material_slots))]
-    
-    for p in source_obj.data.polygons:
-        for pvi in range(len(p.vertices)-2):
-            for v in [(p.vertices[0], p.loop_indices[0]), (p.vertices[pvi+1], p.loop_indices[pvi+1]), (p.vertices[pvi+2], p.loop_indices[pvi+2])]:
-                if v not in vertex_indexes[p.material_index]:
-                    vertex_indexes[p.material_index].append(v)
-                polygons[p.material_index].append(vertex_indexes[p.material_index].index(v))
+    polygons, vertex_indexes = weld_triangles(source_obj.data, len(source_obj.material_slots))
     
     for p in range(len(polygons)):
         if len(polygons[p]) == 0:
             polygons[p] = [0,0,0]
     
-    #vertices = 
-    #normals = [get_tess_normal_by_vertex(source_obj.data, vi) for vi in range(len(source_obj.data.vertices))]
+    # Split normals of every loop, an exported (vertex, loop) pair takes its loop's normal.
+    loop_normals = numpy.empty(len(source_obj.data.loops)*3, numpy.float32)
+    source_obj.data.loops.foreach_get("normal", loop_normals)
+    loop_normals = loop_normals.reshape(-1, 3)
     
     arm = None
     if "SKL_bind" in source_obj.modifiers:
         arm = source_obj.modifiers["SKL_bind"].object
 
     
+    # Vertex group weights are read the first time a shape needs them.
+    table = None
+    influences = None
+    rigid = None
+    
+    mesh_positions = numpy.empty(len(source_obj.data.vertices)*3, numpy.float32)
+    source_obj.data.vertices.foreach_get("co", mesh_positions)
+    mesh_positions = mesh_positions.reshape(-1, 3).astype(numpy.float64)
+    
+    # Positions and normals go back into bone space: rigid shapes through the inverse of the bone
+    # each vertex follows, smooth ones through the inverse of flipYZ. The edit bone matrices are
+    # read in one trip to edit mode and inverted together.
+    bone_inverses = {}
+    unflip = None
+    if arm is not None:
+        unflip = numpy.linalg.inv(numpy.array(flipYZ, numpy.float64))
+        bpy.context.scene.objects.active = arm
+        bpy.ops.object.mode_set(mode='EDIT')
+        bone_names = [eb.name for eb in arm.data.edit_bones]
+        bone_matrices = [numpy.array(eb.matrix, numpy.float64) for eb in arm.data.edit_bones]
+        bpy.ops.object.mode_set(mode='OBJECT')
+        if bone_names:
+            bone_inverses = dict(zip(bone_names, numpy.linalg.inv(numpy.array(bone_matrices))))
+    def to_bone_space(values, vertices, sm, translate):
+        values = numpy.array(values, numpy.float64)
+        if sm == 1:
+            for g in numpy.unique(rigid[vertices]).tolist():
+                if g < 0: continue
+                rows = rigid[vertices] == g
+                inverse = bone_inverses[group_names[g]]
+                values[rows] = values[rows].dot(inverse[:3, :3].T)+(inverse[:3, 3] if translate else 0)
+        elif sm >= 2:
+            values = values.dot(unflip[:3, :3].T)+(unflip[:3, 3] if translate else 0)
+        return values
+    
     totalNumVerts = 0
     for j in range(numPolys):
         if j >= len(vertex_indexes): break
@@ -3854,47 +4495,37 @@ def SaveBFMDL_Mesh(fmdl, fmdlname, source_obj, operator = None):
         s.get_LoD_model(0).skip_count(0)
         lod = s.get_LoD_model(min(fmdl.lod, s.LoD_model_count()))
         
-        removeExtDatItems = []
-        for extdatItem in bpy.context.scene.bfres.data.extra_data:
-            if extdatItem["id"] == lod.offset:
-                lod.get_buffer_offset(extdatItem["orig_data_offset"])
-                lod.get_buffer_size(extdatItem["orig_data_size"])
-                removeExtDatItems.append(extdatItem)
-        for extdatItem in removeExtDatItems:
-            bpy.context.scene.bfres.data.extra_data.remove(extdatItem)
+        extdatItem = bpy.context.scene.bfres.data.extra_data.get(lod.offset)
         
         i_f = lod.index_format_string()
-        bo = lod.get_buffer_offset()
+        bo = lod.get_buffer_offset() if extdatItem is None else extdatItem["orig_data_offset"]
         skip_count = lod.skip_count()
-        size = lod.get_buffer_size()
+        size = lod.get_buffer_size() if extdatItem is None else extdatItem["orig_data_size"]
         
         lod.visibility_group_count(1)
         lod.visibility_group_data_offset(0,0)
         lod.visibility_group_data_count(0,len(polygons[j]))
         
-        o = bo
-        stride = 0
         write_data = b''
-        for bi in range(len(polygons[j])):
-            value = polygons[j][bi]
-            if i_f == "GX2_INDEX_FORMAT_U16":
-                out_data = struct.pack(">H", value)
-                stride=2
-            else:
-                if operator is not None: operator.report({'WARNING'}, "Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
-                print("\t\t\tError: Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
-                break
-            write_data += out_data
-        if len(write_data) >= size:
-            pointers = []
-            pointers.append({"pointer_offset": lod.index_buffer_offset()+0x14, "data_offset": 0})
-            bpy.context.scene.bfres.data.extra_data.append({"id": lod.offset, "data": write_data, "orig_data_size": size, "orig_data_offset": bo, "pointers": pointers})
-            lod.get_buffer_size(len(write_data))
+        if i_f == "GX2_INDEX_FORMAT_U16":
+            write_data = struct.pack(">%dH" % len(polygons[j]), *polygons[j])
+        else:
+            if operator is not None: operator.report({'WARNING'}, "Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
+            print("\t\t\tError: Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
+        pointers = []
+        pointers.append({"pointer_offset": lod.index_buffer_offset()+0x14, "data_offset": 0})
+        if bpy.context.scene.bfres.data.place_extra_data(lod.offset, write_data, bo, size, pointers) is None:
+            lod.get_buffer_size(size)
         else:
-            bpy.context.scene.bfres.data.bytes = bpy.context.scene.bfres.data.bytes[:bo] + write_data + bpy.context.scene.bfres.data.bytes[bo+len(write_data):]
+            lod.get_buffer_size(len(write_data))
         print("\t\t\tImporting Vertex Buffer: %i of %i" % (j+1, numPolys))
         v = FVTX(s.vertex_offset(), fmdl, bpy.context.scene.bfres.data)
         sm = s.vertex_skin_count()
+        corners = numpy.array(vertex_indexes[j], numpy.int64).reshape(-1, 2)
+        if arm is not None and sm == 1 and rigid is None:
+            if table is None: table = vertex_group_table(source_obj.data)
+            group_names = [vg.name for vg in source_obj.vertex_groups]
+            rigid = rigid_groups(table, len(source_obj.data.vertices), [name in bone_inverses for name in group_names])
         vertices = []
         normals = []
         uvs = [[],[],[],[]]
@@ -3904,41 +4535,13 @@ def SaveBFMDL_Mesh(fmdl, fmdlname, source_obj, operator = None):
         for k in range(v.attribute_count()):
             name = v.get_attribute_name(k)
             if name == "_p0":
-                vertices = [source_obj.data.vertices[v[0]].co for v in vertex_indexes[j]]
+                vertices = mesh_positions[corners[:, 0]]
                 if arm is not None:
-                    bpy.context.scene.objects.active = arm
-                    bpy.ops.object.mode_set(mode='EDIT')
-                    for vi, vii in zip(range(len(vertices)), vertex_indexes[j]):
-                        if sm == 1:
-                            for vg in source_obj.vertex_groups:
-                                try:
-                                    if vg.weight(vii[0]) >= 0.5:
-                                        if vg.name in arm.data.edit_bones:
-                                            vertices[vi] = arm.data.edit_bones[vg.name].matrix.inverted()*vertices[vi]
-                                            break
-                                except:
-                                    None
-                        elif sm >= 2:
-                            vertices[vi] = flipYZ.inverted()*vertices[vi]
-                    bpy.ops.object.mode_set(mode='OBJECT')
+                    vertices = to_bone_space(vertices, corners[:, 0], sm, True)
             elif name == "_n0":
-                normals = [get_tess_normal_by_vertex(source_obj.data, vi[0]) for vi in vertex_indexes[j]]
+                normals = loop_normals[corners[:, 1]]
                 if arm is not None:
-                    bpy.context.scene.objects.active = arm
-                    bpy.ops.object.mode_set(mode='EDIT')
-                    for vi, vii in zip(range(len(normals)), vertex_indexes[j]):
-                        if sm == 1:
-                            for vg in source_obj.vertex_groups:
-                                try:
-                                    if vg.weight(vii[0]) >= 0.5:
-                                        if vg.name in arm.data.edit_bones:
-                                            normals[vi] = arm.data.edit_bones[vg.name].matrix.inverted().to_3x3()*Vector(normals[vi])
-                                            break
-                                except:
-                                    None
-                        elif sm >= 2:
-                            normals[vi] = flipYZ.inverted()*Vector(normals[vi])
-                    bpy.ops.object.mode_set(mode='OBJECT')
+                    normals = to_bone_space(normals, corners[:, 0], sm, False)
             elif name == "_u0":
                 if "Map1" in source_obj.data.uv_layers:
                     uvs[0] = [[source_obj.data.uv_layers["Map1"].data[v[1]].uv[0], 1 - source_obj.data.uv_layers["Map1"].data[v[1]].uv[1]] for v in vertex_indexes[j]]
@@ -3964,186 +4567,72 @@ def SaveBFMDL_Mesh(fmdl, fmdlname, source_obj, operator = None):
                     colors[1] = [[source_obj.data.vertex_colors["Color2"].data[v[1]].color[0], source_obj.data.vertex_colors["Color2"].data[v[1]].color[1], source_obj.data.vertex_colors["Color2"].data[v[1]].color[2], source_obj.data.vertex_colors["Alpha2"].data[v[1]].color[0]] for v in vertex_indexes[j]]
                 else: continue
             elif name == "_w0":
-                weights = []
-                skl = fmdl.get_skeleton_data()
-                for vi in vertex_indexes[j]:
-                    vw = []
-                    weight = [0,0,0,0]
-                    for vg in source_obj.vertex_groups:
-                        try:
-                            vw.append(vg.weight(vi[0]))
-                        except:
-                            None
-                    for mri in range(4):
-                        if len(vw) == 0: break
-                        mr = 0
-                        for r in vw:
-                            if r > mr:
-                                mr = r
-                        weight[mri] = mr
-                        vw.remove(mr)
-                    total_Weight = sum(weight)
-                    if total_Weight>0:
-                        for mrii in range(4):
-                            weight[mrii] /= total_Weight
-                    weights.append(weight)
+                if table is None: table = vertex_group_table(source_obj.data)
+                if influences is None: influences = skin_influences(table, len(source_obj.data.vertices))
+                weights = influences[1][corners[:, 0]]
             elif name == "_i0":
-                indexes = []
+                if table is None: table = vertex_group_table(source_obj.data)
+                if influences is None: influences = skin_influences(table, len(source_obj.data.vertices))
+                # Smooth matrix slot of each vertex group's bone, 0 when it has none.
                 skl = fmdl.get_skeleton_data()
-                for vi in vertex_indexes[j]:
-                    vw = []
-                    index = [0,0,0,0]
-                    for vg in source_obj.vertex_groups:
-                        try:
-                            vw.append((vg.weight(vi[0]), vg.name))
-                        except:
-                            None
-                    for mri in range(4):
-                        if len(vw) == 0: break
-                        mr = [0]
-                        for r in vw:
-                            if r[0] > mr[0]:
-                                mr = r
-                        if len(mr) == 1: continue
-                        for bi in range(skl.num_bones()):
-                            if skl.get_bone_name(bi) == mr[1]:
-                                for bii in range(skl.num_bones()):
-                                    if bi == skl.get_smooth_index(bii):
-                                        index[mri] = bii
-                                        break
-                                break
-                        vw.remove(mr)
-                    indexes.append(index)
+                slots = [0]
+                for vg in source_obj.vertex_groups:
+                    bi = skl.bone_index_by_name(vg.name)
+                    bii = skl.get_smooth_slot(bi) if bi is not None else None
+                    slots.append(bii if bii is not None else 0)
+                indexes = numpy.array(slots, numpy.int64)[influences[0][corners[:, 0]]+1]
             else: print("\t\t\tUnsupported Type: " + name);
             
+        exported = {"_p0": vertices, "_n0": normals, "_u0": uvs[0], "_u1": uvs[1], "_u2": uvs[2], "_u3": uvs[3], "_c0": colors[0], "_c1": colors[1], "_w0": weights, "_i0": indexes}
+        num_exported = max(len(values) for values in exported.values())
         for k in range(v.buffer_count()):
             prev_bytes_length = v.get_buffer_stride(k) * lod.skip_count()
             bo = v.get_buffer_offset(k)
             write_data = bpy.context.scene.bfres.data.bytes[bo:bo+prev_bytes_length]
             
-            removeExtDatItems = []
-            for extdatItem in bpy.context.scene.bfres.data.extra_data:
-                if extdatItem["id"] == v.buffer_array_offset()+k*0x18:
-                    v.get_buffer_offset(k, extdatItem["orig_data_offset"])
-                    v.get_buffer_size(k, extdatItem["orig_data_size"])
-                    removeExtDatItems.append(extdatItem)
-            for extdatItem in removeExtDatItems:
-                bpy.context.scene.bfres.data.extra_data.remove(extdatItem)
-            
-            bo = v.get_buffer_offset(k)
-            size = v.get_buffer_size(k)
-            for vi in range(max(len(vertices), len(normals), len(uvs[0]), len(uvs[1]), len(uvs[2]), len(uvs[3]), len(colors[0]), len(colors[1]), len(weights), len(indexes))):
-                for l in range(v.attribute_count()):
-                    va = v.get_attribute_data(l)
-                    if va.buffer_index() != k: continue
-                    name = v.get_attribute_name(l)
-                    value = None
-                    if name == "_p0":
-                        if vi < len(vertices):
-                            value = vertices[vi]
-                    elif name == "_n0":
-                        if vi < len(normals):
-                            value = normals[vi]
-                    elif name == "_u0":
-                        if vi < len(uvs[0]):
-                            value = uvs[0][vi]
-                    elif name == "_u1":
-                        if vi < len(uvs[1]):
-                            value = uvs[1][vi]
-                    elif name == "_u2":
-                        if vi < len(uvs[2]):
-                            value = uvs[2][vi]
-                    elif name == "_u3":
-                        if vi < len(uvs[3]):
-                            value = uvs[3][vi]
-                    elif name == "_c0":
-                        if vi < len(colors[0]):
-                            value = colors[0][vi]
-                    elif name == "_c1":
-                        if vi < len(colors[1]):
-                            value = colors[1][vi]
-                    elif name == "_w0":
-                        if vi < len(weights):
-                            value = weights[vi]
-                    elif name == "_i0":
-                        if vi < len(indexes):
-                            value = indexes[vi]
-                    
-                    if value is not None:
-                        fmt = va.format_string()
-                        if fmt == "float_16_16_16_16":
-                            x = numpy.float16(value[0]).byteswap().tobytes()
-                            y = numpy.float16(value[1]).byteswap().tobytes()
-                            z = numpy.float16(value[2]).byteswap().tobytes()
-                            out_data = x+y+z+b'\0\0'
-                        elif fmt == "float_16_16":
-                            x = numpy.float16(value[0]).byteswap().tobytes()
-                            y = numpy.float16(value[1]).byteswap().tobytes()
-                            out_data = x+y
-                        elif fmt == "float_32_32_32":
-                            out_data = struct.pack(">3f", value[0], value[1], value[2])
-                        elif fmt == "snorm_10_10_10_2":
-                            out_data = _encode_3x_10bit_signed(value[2], value[1], value[0])
-                        elif fmt == "snorm_16_16":
-                            x, y = int(round(value[0]/2*0xffff)), int(round(value[1]/2*0xffff))
-                            if x >= 0x8000: x -= 0x10000
-                            if y >= 0x8000: y -= 0x10000
-                            if min(x,y) < -0x8000 or max(x,y) >= 0x8000:
-                                if operator is not None:
-                                    operator.report({'ERROR'}, "Data value %s goes out of range -1.0 to 1.0 in model %s, data type: %s" % (str(value), fmdlname, name));
-                                    print("Data value %s goes out of range -1.0 to 1.0 in model %s, data type: %s" % (str(value), fmdlname, name));
-                                    return
-                            out_data = struct.pack(">2h", x, y)
-                        elif fmt == "uint_8":
-                            out_data = struct.pack("B", value[0])
-                        elif fmt == "uint_8_8":
-                            out_data = struct.pack("BB", value[0], value[1])
-                        elif fmt == "unorm_8_8":
-                            out_data = struct.pack("BB", int(round(value[0]*255)), int(round(value[1]*255)))
-                        elif fmt == "unorm_16_16":
-                            x, y = int(round(value[0]*0xffff)), int(round(value[1]*0xffff))
-                            if min(x,y) < 0x0 or max(x,y) >= 0x10000:
-                                if operator is not None:
-                                    operator.report({'ERROR'}, "Data value %s goes out of range 0.0 to 1.0 in model %s, data type: %s" % (str(value), fmdlname, name));
-                                    print("Data value %s goes out of range 0.0 to 1.0 in model %s, data type: %s" % (str(value), fmdlname, name));
-                                    return
-                            out_data = struct.pack(">2H", x, y)
-                        
-                        elif fmt == "unorm_8_8_8_8":
-                            if len(value) == 0:
-                                a,b,c,d = 0,0,0,0
-                            elif len(value) == 1:
-                                a,b,c,d = int(round(value[0]*255)),0,0,0
-                            elif len(value) == 2:
-                                a,b,c,d = int(round(value[0]*255)),int(round(value[1]*255)),0,0
-                            elif len(value) == 3:
-                                a,b,c,d = int(round(value[0]*255)),int(round(value[1]*255)),int(round(value[2]*255)),0
-                            else:
-                                a,b,c,d = int(round(value[0]*255)),int(round(value[1]*255)),int(round(value[2]*255)),int(round(value[3]*255))
-                            if min(a,b,c,d) < 0x0 or max(a,b,c,d) >= 0x100:
-                                if operator is not None:
-                                    operator.report({'ERROR'}, "Data value %s goes out of range 0.0 to 1.0 in model %s, data type: %s" % (str(value), fmdlname, name));
-                                    print("Data value %s goes out of range 0.0 to 1.0 in model %s, data type: %s" % (str(value), fmdlname, name));
-                                    return
-                            
-                            out_data = struct.pack("BBBB", a,b,c,d)
-                        elif fmt == "float_32_32":
-                            out_data = struct.pack(">2f", value[0], value[1])
-                        else:
-                            if operator is not None: operator.report({'WARNING'}, "Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
-                            print("\t\t\tError: Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
-                            break
-                    if vi == 0 and fmdl.lod == 0: va.buffer_offset(len(write_data))
-                    write_data += out_data
-                if vi == 0 and fmdl.lod == 0: v.get_buffer_stride(k, len(write_data))
+            extdatItem = bpy.context.scene.bfres.data.extra_data.get(v.buffer_array_offset()+k*0x18)
+            if extdatItem is not None:
+                bo = extdatItem["orig_data_offset"]
+                size = extdatItem["orig_data_size"]
+            else:
+                size = v.get_buffer_size(k)
+            # The buffer's vertices are built as one structured array. LoD 0 repacks the attributes
+            # in order and sets their offsets and the stride, other LoDs keep the existing layout.
+            names, formats, offsets, raw, packed = [], [], [], [], 0
+            for l in range(v.attribute_count()):
+                va = v.get_attribute_data(l)
+                if va.buffer_index() != k: continue
+                name = v.get_attribute_name(l)
+                fmt = va.format_string()
+                values = exported.get(name, [])
+                encoded, bad = encode_values(fmt, values if len(values) == num_exported else numpy.zeros((num_exported, 4)))
+                if encoded is None:
+                    if operator is not None: operator.report({'WARNING'}, "Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
+                    print("\t\t\tError: Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
+                    break
+                if bad.any():
+                    limits = "-1.0 to 1.0" if fmt.startswith("snorm") else "0 to 255" if fmt.startswith("uint") else "0.0 to 1.0"
+                    if operator is not None: operator.report({'ERROR'}, "Data value %s goes out of range %s in model %s, data type: %s" % (str(list(values[numpy.flatnonzero(bad)[0]])), limits, fmdlname, name))
+                    print("Data value %s goes out of range %s in model %s, data type: %s" % (str(list(values[numpy.flatnonzero(bad)[0]])), limits, fmdlname, name))
+                    return
+                names.append(name)
+                formats.append((encoded.dtype, (encoded.shape[1],)))
+                offsets.append(packed if fmdl.lod == 0 else va.buffer_offset())
+                raw.append(encoded)
+                packed += encoded.dtype.itemsize*encoded.shape[1]
+                if num_exported and fmdl.lod == 0: va.buffer_offset(offsets[-1])
+            if num_exported and fmdl.lod == 0: v.get_buffer_stride(k, packed)
+            records = numpy.zeros(num_exported, numpy.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": packed if fmdl.lod == 0 else v.get_buffer_stride(k)}))
+            for name, encoded in zip(names, raw):
+                records[name] = encoded
+            write_data += records.tobytes()
             
-            if len(write_data) >= size:
-                pointers = []
-                pointers.append({"pointer_offset": v.buffer_array_offset()+k*0x18+0x14, "data_offset": 0})
-                bpy.context.scene.bfres.data.extra_data.append({"id": v.buffer_array_offset()+k*0x18, "data": write_data, "orig_data_size": size, "orig_data_offset": bo, "pointers": pointers})
-                v.get_buffer_size(k, len(write_data))
+            pointers = []
+            pointers.append({"pointer_offset": v.buffer_array_offset()+k*0x18+0x14, "data_offset": 0})
+            if bpy.context.scene.bfres.data.place_extra_data(v.buffer_array_offset()+k*0x18, write_data, bo, size, pointers) is None:
+                v.get_buffer_size(k, size)
             else:
-                bpy.context.scene.bfres.data.bytes = bpy.context.scene.bfres.data.bytes[:bo] + write_data + bpy.context.scene.bfres.data.bytes[bo+len(write_data):]
+                v.get_buffer_size(k, len(write_data))
             num_verts = int(ceil(len(write_data)/1.0/v.get_buffer_stride(k)))
             totalNumVerts += num_verts
             if (fmdl.lod+1) < s.LoD_model_count():
@@ -4158,250 +4647,146 @@ def SaveBFMDL_Mesh(fmdl, fmdlname, source_obj, operator = None):
 def LoadBFMDL_Mesh(fmdl, fmdlname, arm=None, target_obj=None, operator = None):
     print("\t\tImporting Vertex Buffers...")
     
-    bm = bmesh.new()
     skl = fmdl.get_skeleton_data()
     numBones = skl.num_bones()
     
+    # Each shape only brings in the vertex range its LoD's faces reference (all of its vertices when
+    # the faces can't be decoded), _pcs[j] is where shape j's range starts in the mesh.
+    numPolys = fmdl.get_polygon_count()
+    geometries = []
     _pcs = [0]
-    ns = []
-    uvls0 = []
-    uvls1 = []
-    uvls2 = []
-    uvls3 = []
-    vcs0 = []
-    vcs1 = []
-    wis = []
-    whts = []
-    for nv in range(fmdl.total_num_vertices()):
-        bm.verts.new()
-        uvls0.append((0,0))
-        uvls1.append((0,0))
-        uvls2.append((0,0))
-        uvls3.append((0,0))
-        vcs0.append((0,0,0))
-        vcs1.append((0,0,0))
-        ns.append((0,0,0))
-        wis.append(None)
-        whts.append(None)
-    bm.verts.ensure_lookup_table()
+    for j in range(numPolys):
+        s = fmdl.get_polygon_data(j)
+        geometries.append(s.geometry(min(fmdl.lod, s.LoD_model_count())))
+        _pcs.append(_pcs[j]+geometries[j].stop-geometries[j].first)
+    positions = numpy.zeros((_pcs[-1], 3), numpy.float32)
+    normals = numpy.zeros((_pcs[-1], 3), numpy.float32)
+    # Per-vertex UVs and RGBA colours by attribute name, only for attributes some shape has.
+    uvs = {}
+    colors = {}
+    wis = numpy.zeros((_pcs[-1], 4), numpy.int64)
+    whts = numpy.zeros((_pcs[-1], 4), numpy.float32)
+    
+    def load_positions(vd, base):
+        c = min(3, vd.shape[1])
+        positions[base:base+len(vd), :c] = vd[:, :c]
+    def load_normals(vd, base):
+        c = min(3, vd.shape[1])
+        nml = numpy.zeros((len(vd), 3), numpy.float32)
+        nml[:, :c] = vd[:, :c]
+        normals[base:base+len(vd)] = nml[:, ::-1]
+    def load_uvs(name):
+        def load(vd, base):
+            if name not in uvs:
+                uvs[name] = numpy.zeros((len(positions), 2), numpy.float32)
+            uv = numpy.zeros((len(vd), 2), numpy.float32)
+            c = min(2, vd.shape[1])
+            uv[:, :c] = vd[:, :c]
+            uv[:, 1] = 1-uv[:, 1]
+            uvs[name][base:base+len(vd)] = uv
+        return load
+    def load_colors(name):
+        def load(vd, base):
+            if name not in colors:
+                colors[name] = numpy.zeros((len(positions), 4), numpy.float32)
+                colors[name][:, 3] = 1
+            c = min(4, vd.shape[1])
+            colors[name][base:base+len(vd), :c] = vd[:, :c]
+        return load
+    def load_indices(vd, base):
+        c = min(4, vd.shape[1])
+        wis[base:base+len(vd), :c] = vd[:, :c]
+    def load_weights(vd, base):
+        c = min(4, vd.shape[1])
+        whts[base:base+len(vd), :c] = vd[:, :c]
+    attribute_loaders = {
+        "_p0": load_positions,
+        "_n0": load_normals,
+        "_u0": load_uvs("_u0"),
+        "_u1": load_uvs("_u1"),
+        "_u2": load_uvs("_u2"),
+        "_u3": load_uvs("_u3"),
+        "_c0": load_colors("_c0"),
+        "_c1": load_colors("_c1"),
+        "_i0": load_indices,
+        "_w0": load_weights,
+    }
     
-    _vseek = 0
-    numPolys = fmdl.get_polygon_count()
     for j in range(numPolys):
         print("\t\t\tImporting Vertex Buffer: %i of %i" % (j+1, numPolys))
         s = fmdl.get_polygon_data(j)
         v = FVTX(s.vertex_offset(), fmdl, bpy.context.scene.bfres.data)
+        attributes = geometries[j].attributes
         for k in range(v.attribute_count()):
             va = v.get_attribute_data(k)
             name = v.get_attribute_name(k)
-            if name == "_p0": None
-            elif name == "_n0": None
-            elif name == "_u0":
-                None
-            elif name == "_u1":
-                None
-            elif name == "_u2":
-                None
-            elif name == "_u3":
-                None
-            elif name == "_c0":
-                None
-            elif name == "_c1":
-                None
-            elif name == "_i0":
-                None
-            elif name == "_w0":
-                None
-            else: print("\t\t\tUnsupported Type: " + name, "offset: "+hex(v.get_buffer_offset(va.buffer_index())+va.buffer_offset())); continue
-            fmt = va.format_string()
-            bo = v.get_buffer_offset(va.buffer_index())+va.buffer_offset()
-            vd = []
-            stride = v.get_buffer_stride(va.buffer_index())
-            size = v.get_buffer_size(va.buffer_index())
-            for vi in range(v.num_vertices()):
-                o = bo + vi*stride
-                if fmt == "float_32_32_32":
-                    vd.append(struct.unpack(">3f", bpy.context.scene.bfres.data.bytes[o:o+0xC]))
-                elif fmt == "float_16_16_16_16":
-                    vd.append(numpy.frombuffer(bpy.context.scene.bfres.data.bytes[o:o+0x8 ], dtype=">4f2")[0].tolist())
-                elif fmt == "snorm_16_16":
-                    val = numpy.frombuffer(bpy.context.scene.bfres.data.bytes[o:o+0x4 ], dtype=">2h")[0].tolist()
-                    val[0]/=0x7FFF
-                    val[1]/=0x7FFF
-                    vd.append(val)
-                elif fmt == "unorm_16_16":
-                    val = numpy.frombuffer(bpy.context.scene.bfres.data.bytes[o:o+0x4 ], dtype=">2H")[0].tolist()
-                    val[0]/=0xFFFF
-                    val[1]/=0xFFFF
-                    vd.append(val)
-                elif fmt == "float_32_32":
-                    vd.append(numpy.frombuffer(bpy.context.scene.bfres.data.bytes[o:o+0x8 ], dtype=">2f")[0].tolist())
-                elif fmt == "float_16_16":
-                    vd.append(numpy.frombuffer(bpy.context.scene.bfres.data.bytes[o:o+0x4 ], dtype=">2f2")[0].tolist())
-                elif fmt == "snorm_10_10_10_2":
-                    vd.append(_parse_3x_10bit_signed(bpy.context.scene.bfres.data.bytes, o))
-                elif fmt == "uint_8":
-                    vd.append((bpy.context.scene.bfres.data.bytes[o],))
-                elif fmt == "uint_8_8":
-                    vd.append((bpy.context.scene.bfres.data.bytes[o],bpy.context.scene.bfres.data.bytes[o+1]))
-                elif fmt == "uint_8_8_8_8":
-                    vd.append((bpy.context.scene.bfres.data.bytes[o],bpy.context.scene.bfres.data.bytes[o+1],bpy.context.scene.bfres.data.bytes[o+2],bpy.context.scene.bfres.data.bytes[o+3]))
-                elif fmt == "unorm_8_8":
-                    vd.append((bpy.context.scene.bfres.data.bytes[o]/255.0,bpy.context.scene.bfres.data.bytes[o+1]/255.0))
-                elif fmt == "snorm_8_8":
-                    vd.append((bpy.context.scene.bfres.data.bytes[o]/255.0,bpy.context.scene.bfres.data.bytes[o+1]/255.0))
-                elif fmt == "unorm_8_8_8_8":
-                    vd.append((bpy.context.scene.bfres.data.bytes[o]/255.0,bpy.context.scene.bfres.data.bytes[o+1]/255.0,bpy.context.scene.bfres.data.bytes[o+2]/255.0,bpy.context.scene.bfres.data.bytes[o+3]/255.0))
-                else:
-                    if operator is not None: operator.report({'WARNING'}, "Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
-                    print("\t\t\tError: Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
-                    break
-            if v.get_attribute_name(k) == "_p0":
-                vi = 0
-                for vtx in vd:
-                    while len(vtx) < 3:
-                        vtx.append(0)
-                    _vseek = vi+_pcs[j]
-                    bm.verts[_vseek].co = (vtx[0], vtx[1], vtx[2])
-                    vi+=1
-            if v.get_attribute_name(k) == "_n0":
-                ni = 0
-                for nml in vd:
-                    while len(nml) < 3:
-                        nml.append(0)
-                    ns[ni + _pcs[j]] = (nml[2],nml[1],nml[0])
-                    bm.verts[ni+_pcs[j]].normal = (nml[2],nml[1],nml[0])
-                    ni+=1
-            if v.get_attribute_name(k) == "_u0":
-                ui = 0
-                for uv in vd:
-                    while len(uv) < 2:
-                        uv.append(0)
-                    uvls0[ui + _pcs[j]] = (uv[0], 1-uv[1])
-                    ui += 1
-            if v.get_attribute_name(k) == "_u1":
-                ui = 0
-                for uv in vd:
-                    while len(uv) < 2:
-                        uv.append(0)
-                    uvls1[ui + _pcs[j]] = (uv[0], 1-uv[1])
-                    ui += 1
-            if v.get_attribute_name(k) == "_u2":
-                ui = 0
-                for uv in vd:
-                    while len(uv) < 2:
-                        uv.append(0)
-                    uvls2[ui + _pcs[j]] = (uv[0], 1-uv[1])
-                    ui += 1
-            if v.get_attribute_name(k) == "_u3":
-                ui = 0
-                for uv in vd:
-                    while len(uv) < 2:
-                        uv.append(0)
-                    uvls3[ui + _pcs[j]] = (uv[0], 1-uv[1])
-                    ui += 1
-            if v.get_attribute_name(k) == "_c0":
-                ci = 0
-                for color in vd:
-                    while len(color) < 3:
-                        color.append(0)
-                    vcs0[ci + _pcs[j]] = (color[0], color[1], color[2])
-                    ci += 1
-            if v.get_attribute_name(k) == "_c1":
-                ci = 0
-                for color in vd:
-                    while len(color) < 3:
-                        color.append(0)
-                    vcs1[ci + _pcs[j]] = (color[0], color[1], color[2])
-                    ci += 1
-            if v.get_attribute_name(k) == "_i0":
-                wi = 0
-                for wv in vd:
-                    wis[wi + _pcs[j]] = wv
-                    wi += 1
-            if v.get_attribute_name(k) == "_w0":
-                whi = 0
-                for whv in vd:
-                    whts[whi + _pcs[j]] = whv
-                    whi += 1
-        _pcs.append(_vseek+1)
-    mi = []
+            if name not in attribute_loaders: print("\t\t\tUnsupported Type: " + name, "offset: "+hex(v.get_buffer_offset(va.buffer_index())+va.buffer_offset())); continue
+            if name not in attributes:
+                fmt = va.format_string()
+                if operator is not None: operator.report({'WARNING'}, "Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
+                print("\t\t\tError: Unrecognized buffer format detected: %s in model %s" % (fmt, fmdlname))
+                continue
+            attribute_loaders[name](attributes[name], _pcs[j])
+    faces = [numpy.empty((0, 3), numpy.int64)]
+    mi = [numpy.empty(0, numpy.int64)]
     pmi = []
     print("\t\tImporting Polygons...")
     for j in range(numPolys):
         print("\t\t\tImporting Polygon: %i of %i" % (j+1, numPolys))
         s = fmdl.get_polygon_data(j)
         lod = s.get_LoD_model(min(fmdl.lod, s.LoD_model_count()))
-        pt = lod.primitive_type_string()
-        i_f = lod.index_format_string()
-        bo = lod.get_buffer_offset()
-        skip_count = lod.skip_count()
-        id = []
-        size = lod.get_buffer_size()
-        stride = 0
-        if i_f == "GX2_INDEX_FORMAT_U16":
-            stride = 2
-            
-        for vis_grp in range(lod.visibility_group_count()):
-            offset = lod.visibility_group_data_offset(vis_grp)
-            for bi in range(lod.visibility_group_data_count(vis_grp)):
-                o = bo + offset + bi * stride
-                if i_f == "GX2_INDEX_FORMAT_U16":
-                    id.append(struct.unpack(">H", bpy.context.scene.bfres.data.bytes[o:o+2])[0]+skip_count)
-                else:
-                    if operator is not None: operator.report({'WARNING'}, "Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
-                    print("\t\t\tError: Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
-                    break
-        _tri = []
-        for index in id:
-            if pt == "GX2_PRIMITIVE_TRIANGLES":
-                _tri.append(index)
-                if len(_tri) == 3:
-                    try:
-                        face = bm.faces.new((bm.verts[_tri[0]+_pcs[j]],bm.verts[_tri[1]+_pcs[j]],bm.verts[_tri[2]+_pcs[j]]))
-                        face.smooth = True
-                        mi.append(j)
-                    except:
-                        None
-                    _tri = []
-            else:
-                if operator is not None: operator.report({'WARNING'}, "Unrecognized primitive type detected: %s in model %s" % (pt, fmdlname))
-                print("\t\t\tError: Unrecognized primitive type detected: %s in model %s" % (pt, fmdlname))
-                break
+        shape_faces = geometries[j].faces
+        if lod.index_format() not in index_formats:
+            i_f = lod.index_format_string()
+            if operator is not None: operator.report({'WARNING'}, "Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
+            print("\t\t\tError: Unrecognized index format detected: %s in model %s" % (i_f, fmdlname))
+        elif lod.primitive_type() not in primitive_triangulators:
+            pt = lod.primitive_type_string()
+            if operator is not None: operator.report({'WARNING'}, "Unrecognized primitive type detected: %s in model %s" % (pt, fmdlname))
+            print("\t\t\tError: Unrecognized primitive type detected: %s in model %s" % (pt, fmdlname))
+        else:
+            # Faces reaching outside the shape's vertex range are out of range, drop them here
+            # before they're moved into the mesh's numbering.
+            shape_faces = shape_faces[((shape_faces >= geometries[j].first) & (shape_faces < geometries[j].stop)).all(1)]
+            faces.append(shape_faces-geometries[j].first+_pcs[j])
+            mi.append(numpy.full(len(shape_faces), j, numpy.int64))
         pmi.append(s.material_index())
-    
-    bm.faces.ensure_lookup_table()
+    faces, mi = clean_faces(numpy.concatenate(faces), numpy.concatenate(mi), len(positions))
+    mi = mi.tolist()
     
     if target_obj is None:
         if fmdlname in bpy.data.meshes:
             bpy.data.meshes.remove(bpy.data.meshes[fmdlname])
         m = bpy.data.meshes.new(fmdlname)
-    else: m = target_obj.data
+    else:
+        m = target_obj.data
+        bmesh.new().to_mesh(m)
     
-    bm.to_mesh(m)
+    m.vertices.add(len(positions))
+    m.vertices.foreach_set("co", positions.ravel())
+    m.loops.add(len(faces)*3)
+    m.loops.foreach_set("vertex_index", faces.astype(numpy.int32).ravel())
+    m.polygons.add(len(faces))
+    m.polygons.foreach_set("loop_start", numpy.arange(0, len(faces)*3, 3, dtype=numpy.int32))
+    m.polygons.foreach_set("loop_total", numpy.full(len(faces), 3, numpy.int32))
+    m.polygons.foreach_set("use_smooth", [True]*len(faces))
+    m.update(calc_edges=True)
+    m.vertices.foreach_set("normal", normals.ravel())
     
-    uvtt0 = m.uv_textures.new("Map1")
-    uvtl0 = m.uv_layers["Map1"]
-    uvtt1 = m.uv_textures.new("Map2")
-    uvtl1 = m.uv_layers["Map2"]
-    uvtt2 = m.uv_textures.new("Map3")
-    uvtl2 = m.uv_layers["Map3"]
-    uvtt3 = m.uv_textures.new("Map4")
-    uvtl3 = m.uv_layers["Map4"]
-    color_map0 = m.vertex_colors.new("Color1")
-    color_alpha0 = m.vertex_colors.new("Alpha1")
-    color_map1 = m.vertex_colors.new("Color2")
-    color_alpha1 = m.vertex_colors.new("Alpha2")
-    for p in m.polygons:
-        for vi in range(len(p.loop_indices)):
-            uvtl0.data[p.loop_indices[vi]].uv = uvls0[p.vertices[vi]]
-            uvtl1.data[p.loop_indices[vi]].uv = uvls1[p.vertices[vi]]
-            uvtl2.data[p.loop_indices[vi]].uv = uvls2[p.vertices[vi]]
-            uvtl3.data[p.loop_indices[vi]].uv = uvls3[p.vertices[vi]]
-            color_map0.data[p.loop_indices[vi]].color = vcs0[p.vertices[vi]]
-            color_alpha0.data[p.loop_indices[vi]].color = (vcs0[p.vertices[vi]][3],vcs0[p.vertices[vi]][3],vcs0[p.vertices[vi]][3]) if len(vcs0[p.vertices[vi]]) >= 4 else (1,1,1)
-            color_map1.data[p.loop_indices[vi]].color = vcs1[p.vertices[vi]]
-            color_alpha1.data[p.loop_indices[vi]].color = (vcs1[p.vertices[vi]][3],vcs1[p.vertices[vi]][3],vcs1[p.vertices[vi]][3]) if len(vcs1[p.vertices[vi]]) >= 4 else (1,1,1)
+    # Loop layers are filled by indexing the per-vertex arrays with each loop's vertex.
+    loop_vertices = numpy.empty(len(m.loops), numpy.int32)
+    m.loops.foreach_get("vertex_index", loop_vertices)
+    uvtt0 = None
+    for name, layer in (("_u0", "Map1"), ("_u1", "Map2"), ("_u2", "Map3"), ("_u3", "Map4")):
+        if name not in uvs: continue
+        uvtt = m.uv_textures.new(layer)
+        if name == "_u0": uvtt0 = uvtt
+        m.uv_layers[layer].data.foreach_set("uv", uvs[name][loop_vertices].ravel())
+    for name, color_layer, alpha_layer in (("_c0", "Color1", "Alpha1"), ("_c1", "Color2", "Alpha2")):
+        if name not in colors: continue
+        loop_colors = colors[name][loop_vertices]
+        m.vertex_colors.new(color_layer).data.foreach_set("color", loop_colors[:, :3].ravel())
+        m.vertex_colors.new(alpha_layer).data.foreach_set("color", loop_colors[:, [3, 3, 3]].ravel())
     
     
     
@@ -4461,11 +4846,16 @@ def LoadBFMDL_Mesh(fmdl, fmdlname, arm=None, target_obj=None, operator = None):
         m.materials.append(mats[pmii])
     
     
-    for pi in range(len(m.polygons)):
-        m.polygons[pi].material_index = mi[pi]
-        if m.materials[mi[pi]].texture_slots[0] is not None:
-            if m.materials[mi[pi]].texture_slots[0].texture is not None:
-                uvtt0.data[pi].image = m.materials[mi[pi]].texture_slots[0].texture.image
+    m.polygons.foreach_set("material_index", mi)
+    if uvtt0 is not None:
+        # Each polygon shows the image of its material's first texture slot.
+        images = []
+        for mat in m.materials:
+            ts = mat.texture_slots[0]
+            images.append(ts.texture.image if ts is not None and ts.texture is not None else None)
+        for pi in range(len(m.polygons)):
+            if images[mi[pi]] is not None:
+                uvtt0.data[pi].image = images[mi[pi]]
     #vc = m.vertex_colors.new("normTest")
     #v = 0
     #for t in bm.faces:
@@ -4486,56 +4876,54 @@ def LoadBFMDL_Mesh(fmdl, fmdlname, arm=None, target_obj=None, operator = None):
     o.modifiers.new("SKL_bind", 'ARMATURE').object = arm
     
     print("\t\tBinding Vertices to Bones...")
-    for iii in range(_pcs[len(_pcs)-1]):
-        iik = 0
-        for iij in range(1, len(_pcs)):
-            if iii >= _pcs[iij-1] and iii < _pcs[iij]:
-                break
-            iik+=1
-        s = fmdl.get_polygon_data(iik)
+    # Edit bone matrices are read in one trip to edit mode, then every shape is bound and
+    # transformed as a whole vertex range, with one vertex_groups add() per (bone, weight).
+    bone_matrices = {}
+    if arm is not None:
+        bpy.context.scene.objects.active = arm
+        bpy.ops.object.mode_set(mode='EDIT')
+        for eb in arm.data.edit_bones:
+            bone_matrices[eb.name] = numpy.array(eb.matrix, numpy.float64)
+        bpy.ops.object.mode_set(mode='OBJECT')
+    positions = positions.astype(numpy.float64)
+    normals = normals.astype(numpy.float64)
+    def transform(vertices, mtx):
+        positions[vertices] = positions[vertices].dot(mtx[:3, :3].T)+mtx[:3, 3]
+        normals[vertices] = normals[vertices].dot(mtx[:3, :3].T)
+    def smooth_bone_name(i):
+        return skl.get_bone_name(skl.get_smooth_index(i))
+    for j in range(numPolys):
+        vertices = numpy.arange(_pcs[j], _pcs[j+1])
+        s = fmdl.get_polygon_data(j)
         sm = s.vertex_skin_count()
         if sm == 0:
-            bone_index = s.skeleton_index()
-            bname = skl.get_bone_name(bone_index, True)
-            o.vertex_groups[bname].add((iii,), 1, 'ADD')
-            if arm is not None:
-                bpy.context.scene.objects.active = arm
-                bpy.ops.object.mode_set(mode='EDIT')
-                if bname not in arm.data.edit_bones: continue
-                mtx = arm.data.edit_bones[bname].matrix
-                bpy.ops.object.mode_set(mode='OBJECT')
-                m.vertices[iii].co = mtx*m.vertices[iii].co
-                m.vertices[iii].normal = mtx.to_3x3()*m.vertices[iii].normal
-                ns[iii] = (mtx.to_3x3()*Vector(ns[iii])).to_tuple()
+            bname = skl.get_bone_name(s.skeleton_index(), True)
+            o.vertex_groups[bname].add(vertices.tolist(), 1, 'ADD')
+            if bname in bone_matrices:
+                transform(vertices, bone_matrices[bname])
         elif sm == 1:
-            bone_index = skl.get_smooth_index(wis[iii][0])
-            bname = skl.get_bone_name(bone_index)
-            o.vertex_groups[bname].add((iii,), 1, 'ADD')
-            if arm is not None:
-                bpy.context.scene.objects.active = arm
-                bpy.ops.object.mode_set(mode='EDIT')
-                if bname not in arm.data.edit_bones: continue
-                mtx = arm.data.edit_bones[bname].matrix
-                bpy.ops.object.mode_set(mode='OBJECT')
-                m.vertices[iii].co = mtx*m.vertices[iii].co
-                m.vertices[iii].normal = mtx.to_3x3()*m.vertices[iii].normal
-                ns[iii] = (mtx.to_3x3()*Vector(ns[iii])).to_tuple()
-        elif sm >= 2:
+            for i in numpy.unique(wis[vertices, 0]).tolist():
+                bound = vertices[wis[vertices, 0] == i]
+                bname = smooth_bone_name(i)
+                o.vertex_groups[bname].add(bound.tolist(), 1, 'ADD')
+                if bname in bone_matrices:
+                    transform(bound, bone_matrices[bname])
+        else:
             for w in range(sm):
-                bone_index = skl.get_smooth_index(wis[iii][w])
-                bname = skl.get_bone_name(bone_index)
-                o.vertex_groups[bname].add((iii,), whts[iii][w], 'ADD')
-            m.vertices[iii].co = flipYZ*m.vertices[iii].co
-            m.vertices[iii].normal = flipYZ.to_3x3()*m.vertices[iii].normal
-            ns[iii] = (flipYZ.to_3x3()*Vector(ns[iii])).to_tuple()
+                for i in numpy.unique(wis[vertices, w]).tolist():
+                    bound = vertices[wis[vertices, w] == i]
+                    weights = whts[bound, w]
+                    for weight in numpy.unique(weights).tolist():
+                        o.vertex_groups[smooth_bone_name(i)].add(bound[weights == weight].tolist(), weight, 'ADD')
+            transform(vertices, numpy.array(flipYZ, numpy.float64))
+    m.vertices.foreach_set("co", positions.astype(numpy.float32).ravel())
+    m.vertices.foreach_set("normal", normals.astype(numpy.float32).ravel())
     
     print("\t\tFinalizing Model...")
     m.use_auto_smooth = True
-    nms = []
-    for n in ns:
-        nms.append(Vector(n).normalized())
-    
-    m.normals_split_custom_set_from_vertices(nms)
+    lengths = numpy.sqrt((normals*normals).sum(1))
+    lengths[lengths == 0] = 1
+    m.normals_split_custom_set_from_vertices((normals/lengths[:, None]).tolist())
     
     if target_obj is None: bpy.context.scene.objects.link(o)
 def SaveBFMDL_Skeleton(fmdl, fmdlname, arm, operator=None):
@@ -4675,12 +5063,13 @@ class ImportBFRES(Operator, ImportHelper):
             options={'HIDDEN'},
             maxlen=255,
             )
+    use_mmap = BoolProperty(name="Memory-Mapped", description="Map the file instead of reading it into memory; edits are kept in copy-on-write pages")
     @classmethod
     def poll(cls, context):
         return True
     
     def execute(self, context):
-        context.scene.bfres.data = BFRES(self.filepath)
+        context.scene.bfres.data = BFRES(self.filepath, use_mmap=self.use_mmap)
         print("BFRES Loaded.")
         return {'FINISHED'}
 
@@ -4833,11 +5222,37 @@ class RestoreBFRES(bpy.types.Operator):
         return context.scene.bfres.data is not None
 
     def execute(self, context):
-        context.scene.bfres.data.bytes = context.scene.bfres.data.orig_bytes
+        context.scene.bfres.data.restore()
         return {'FINISHED'}
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self)
 
+class UndoBFRESEdit(bpy.types.Operator):
+    """Reverts the last edit made to the BFRES"""
+    bl_idname = "scene.undobfresedit"
+    bl_label = "Undo BFRES Edit"
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.bfres.data is not None and context.scene.bfres.data.can_undo()
+
+    def execute(self, context):
+        context.scene.bfres.data.undo()
+        return {'FINISHED'}
+
+class RedoBFRESEdit(bpy.types.Operator):
+    """Reapplies the last undone edit to the BFRES"""
+    bl_idname = "scene.redobfresedit"
+    bl_label = "Redo BFRES Edit"
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.bfres.data is not None and context.scene.bfres.data.can_redo()
+
+    def execute(self, context):
+        context.scene.bfres.data.redo()
+        return {'FINISHED'}
+
 
 class SaveBFRESToFile(bpy.types.Operator, ExportHelper):
     """Saves the BFRES to file"""
@@ -4851,10 +5266,7 @@ class SaveBFRESToFile(bpy.types.Operator, ExportHelper):
         return context.scene.bfres.data is not None
 
     def execute(self, context):
-        f = open(self.filepath, "wb")
-        f.write(context.scene.bfres.data.bytes)
-        f.close()
-        context.scene.bfres.data.orig_bytes = context.scene.bfres.data.bytes
+        context.scene.bfres.data.save(self.filepath)
         return {'FINISHED'}
     
 class SaveBFRESToFilePatches(bpy.types.Operator, ExportHelper):
@@ -4877,10 +5289,11 @@ class SaveBFRESToFilePatches(bpy.types.Operator, ExportHelper):
         same_count = 0
         patch_end = -1
         dirpath, filename = os.path.split(self.filepath)
-        filesize = len(context.scene.bfres.data.orig_bytes)
+        orig_bytes = context.scene.bfres.data.original_bytes()
+        filesize = len(orig_bytes)
         patchdir = hex(hash(filename)%(0x10**8))[2:]
         for i in range(filesize):
-            oldB, newB = context.scene.bfres.data.orig_bytes[i], context.scene.bfres.data.bytes[i]
+            oldB, newB = orig_bytes[i], context.scene.bfres.data.bytes[i]
             if oldB!=newB:
                 if (same_count <= 0):
                     patch_start = i
@@ -4894,6 +5307,7 @@ class SaveBFRESToFilePatches(bpy.types.Operator, ExportHelper):
                     patch_start = -1
         AddBytes = 0
         for extra_data in context.scene.bfres.data.extra_data:
+            if extra_data["resident"]: continue
             patches[filesize+AddBytes+self.extra_data_bias] = extra_data["data"]
             for pointer in extra_data["pointers"]:
                 for pi in range(4):
@@ -5056,7 +5470,9 @@ class SaveBFMDLSkeletonfromScene(bpy.types.Operator):
     
     def execute(self, context):
         if context.scene.bfmdl_source_armature not in context.scene.objects: self.report({'ERROR'}, "Source object's armature not specified."); return {'CANCELLED'}
+        context.scene.bfres.data.begin_edit("Import Skeleton")
         SaveBFMDL_Skeleton(context.scene.bfres.data.models[self.bfmdl_id], self.bfmdl_id, context.scene.objects[context.scene.bfmdl_source_armature], operator=self)
+        context.scene.bfres.data.end_edit()
         return {'FINISHED'}
 class LoadBFMDLtoScene(bpy.types.Operator):
     """Loads the BFMDL model into the target blender object"""
@@ -5085,7 +5501,9 @@ class SaveBFMDLfromScene(bpy.types.Operator):
     
     def execute(self, context):
         if context.scene.bfmdl_source_model not in context.scene.objects: self.report({'ERROR'}, "Source object not specified."); return {'CANCELLED'}
+        context.scene.bfres.data.begin_edit("Import Model")
         SaveBFMDL_Mesh(context.scene.bfres.data.models[self.bfmdl_id], self.bfmdl_id, source_obj = context.scene.objects[context.scene.bfmdl_source_model], operator=self)
+        context.scene.bfres.data.end_edit()
         return {'FINISHED'}
 
 class ExportBFTEXMipmapToImage(bpy.types.Operator):
@@ -5119,7 +5537,9 @@ class ImportBFTEXMipmapFromImage(bpy.types.Operator):
     def execute(self, context):
         ftex = context.scene.bfres.data.textures[self.bftex_id]
         print("Import texture %s mip %i from blender image %s" % (self.bftex_id, self.mip_id, str(bpy.data.images[context.scene.bftex_source_image])))
+        context.scene.bfres.data.begin_edit("Import Texture")
         SaveBFTEX(ftex, self.bftex_id, self.mip_id, bpy.data.images[context.scene.bftex_source_image], operator=self)
+        context.scene.bfres.data.end_edit()
         return {'FINISHED'}
 
 class OpenCEMUBFRESFINDER(bpy.types.Operator):
@@ -5200,6 +5620,9 @@ class BFRESMainToolPanel(View3DPanel, bpy.types.Panel):
         row = layout.row()
         row.operator("scene.import_bfres")
         layout.row().operator("scene.restorebfres")
+        row = layout.row()
+        row.operator("scene.undobfresedit")
+        row.operator("scene.redobfresedit")
         layout.row().operator("scene.savebfrestofile")
         layout.row().operator("scene.savebfrestofilepatch")
         if len(context.scene.objects) != 0:
@@ -5341,6 +5764,8 @@ def register():
     bpy.utils.register_class(GetBFRESList)
     bpy.utils.register_class(DownloadBFRES)
     bpy.utils.register_class(RestoreBFRES)
+    bpy.utils.register_class(UndoBFRESEdit)
+    bpy.utils.register_class(RedoBFRESEdit)
     bpy.utils.register_class(SaveBFRESToFilePatches)
     bpy.utils.register_class(SaveBFRESToFile)
     bpy.utils.register_class(ShowHideBFTEXTools)
@@ -5374,6 +5799,8 @@ def unregister():
     bpy.utils.unregister_class(GetBFRESList)
     bpy.utils.unregister_class(DownloadBFRES)
     bpy.utils.unregister_class(RestoreBFRES)
+    bpy.utils.unregister_class(UndoBFRESEdit)
+    bpy.utils.unregister_class(RedoBFRESEdit)
     bpy.utils.unregister_class(SaveBFRESToFilePatches)
     bpy.utils.unregister_class(SaveBFRESToFile)
     bpy.utils.unregister_class(ShowHideBFTEXTools)